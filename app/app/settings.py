@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -86,13 +87,23 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 
+# DB_POOLER=1 when connecting through a transaction pooling proxy such
+# as PgBouncer: server side cursors do not survive across transactions.
+DB_POOLER = bool(int(os.environ.get('DB_POOLER', 0)))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(
+            os.environ.get('DB_CONN_HEALTH_CHECKS', 1)
+        )),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER,
     }
 }
 
@@ -141,6 +152,16 @@ STATIC_ROOT = '/vol/web/static'
 
 MEDIA_ROOT = '/vol/web/media'
 
+# uploads are stored once per content under their sha256, see gc_media
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+
+# STATIC_MANIFEST=1 makes collectstatic write hashed names plus .gz/.br
+# copies; templates then need the manifest, so only enable it where
+# collectstatic runs before the app starts.
+STATIC_MANIFEST = bool(int(os.environ.get('STATIC_MANIFEST', 0)))
+if STATIC_MANIFEST:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -148,10 +169,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# FAST_JSON=1 renders and parses JSON with orjson where it is installed,
+# producing the same output as DRF's stdlib JSONRenderer/JSONParser.
+FAST_JSON = bool(int(os.environ.get('FAST_JSON', 1)))
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer' if FAST_JSON
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser' if FAST_JSON
+        else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True
 }
+
+# Schema written at deploy with
+# `manage.py spectacular --format openapi-json --file $API_SCHEMA_FILE`.
+# Without it /api/schema/ generates the schema once per process.
+API_SCHEMA_FILE = os.environ.get('API_SCHEMA_FILE') or None
+
+# Token lookups cached by user.authentication.CachedTokenAuthentication.
+# Each process keeps its own LRU, so a deleted token or deactivated user
+# may still authenticate in other workers for up to TTL seconds. Set
+# CACHE_ALIAS to a shared cache to reuse lookups across processes.
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 1024)),
+    'TTL': int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 30)),
+    'CACHE_ALIAS': os.environ.get('TOKEN_AUTH_CACHE_ALIAS') or None,
+}
+
+# Recipe list responses cached per user and collection version.
+RECIPE_RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.environ.get('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)),
+}
+
+# Resized renditions of uploaded recipe images, rendered in the background.
+# BACKEND is any class with an enqueue(recipe_id, name) method. The default
+# thread pool keeps its queue in memory, so images still waiting when the
+# process restarts keep empty renditions until `manage.py render_images`
+# runs; failed jobs are logged by recipe.images and left for it as well.
+RECIPE_IMAGES = {
+    'BACKEND': os.environ.get(
+        'RECIPE_IMAGE_BACKEND', 'recipe.images.ThreadPoolBackend',
+    ),
+    'WORKERS': int(os.environ.get('RECIPE_IMAGE_WORKERS', 2)),
+    'SIZES': {'small': 320, 'medium': 1024},
+    # uploads are rejected while streaming past either limit
+    'MAX_UPLOAD_SIZE': int(os.environ.get(
+        'RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024,
+    )),
+    'MAX_PIXELS': int(os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40_000_000)),
+}
@@ -0,0 +1,45 @@
+"""
+PostgreSQL backend with health checks for persistent connections
+"""
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Check a reused persistent connection once per request, before its
+    first query, and reconnect if the server dropped it.
+
+    Enabled with the CONN_HEALTH_CHECKS database setting.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get(
+            'CONN_HEALTH_CHECKS', False,
+        )
+        self.health_check_done = False
+
+    def connect(self):
+        # a fresh connection needs no check
+        super().connect()
+        self.health_check_done = True
+        # may be another database now, see core.models.has_trigram
+        self.trigram_support = None
+
+    def close_if_unusable_or_obsolete(self):
+        # runs at the start and end of each request; the next query checks
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        """ close a reused connection the server no longer answers on """
+        if (self.connection is None or not self.health_check_enabled or
+                self.health_check_done or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
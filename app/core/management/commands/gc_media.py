@@ -0,0 +1,70 @@
+"""
+Django command to delete uploaded files no recipe refers to
+"""
+import os
+import time
+from typing import Any
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect media files"""
+    help = (
+        'Delete files under the upload directory that no recipe image or '
+        'rendition refers to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', default='uploads',
+            help='storage directory to collect',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='keep files modified less than this many seconds ago, '
+                 'they may belong to uploads not committed yet',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report what would be deleted',
+        )
+
+    def _walk(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self._walk(os.path.join(directory, name))
+
+    def handle(self, *args: Any, **options: Any):
+        prefix = options['prefix']
+        if not default_storage.exists(prefix):
+            self.stdout.write(f'Nothing to collect under {prefix}')
+            return
+        referenced = Recipe.objects.file_names()
+        cutoff = time.time() - options['min_age']
+        deleted = kept = freed = 0
+        for name in self._walk(prefix):
+            if name in referenced:
+                kept += 1
+                continue
+            if default_storage.get_modified_time(name).timestamp() > cutoff:
+                kept += 1
+                continue
+            size = default_storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(f'would delete {name}', self.style.NOTICE)
+            else:
+                default_storage.delete(name)
+                self.stdout.write(f'deleted {name}', self.style.NOTICE)
+            deleted += 1
+            freed += size
+
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {deleted} files ({freed} bytes), kept {kept}'
+        ))
@@ -0,0 +1,191 @@
+"""
+Django command to import recipes from an NDJSON or CSV stream
+"""
+import csv
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Ingredient, Recipe, RecipeCollectionVersion, Tag
+
+CSV_LIST_SEPARATOR = '|'
+
+
+class Command(BaseCommand):
+    """Django command to bulk import recipes"""
+    help = (
+        'Import recipes from an NDJSON or CSV file (or "-" for stdin). '
+        'Rows are read lazily and written in batches.'
+    )
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='input file, or "-" for stdin')
+        parser.add_argument(
+            '--format', choices=['ndjson', 'csv'], dest='input_format',
+            help='input format, guessed from the file extension by default',
+        )
+        parser.add_argument(
+            '--user',
+            help='email of the owner for rows without a "user" column',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='use bulk inserts for links even on postgres',
+        )
+
+    def _rows(self, stream, input_format):
+        if input_format == 'csv':
+            for row in csv.DictReader(stream):
+                for name in ('tags', 'ingredients'):
+                    value = row.get(name) or ''
+                    row[name] = [
+                        item for item in value.split(CSV_LIST_SEPARATOR)
+                        if item
+                    ]
+                yield row
+        else:
+            # decoded by _build, so a malformed line only skips its row
+            for line in stream:
+                if line.strip():
+                    yield line
+
+    def _names(self, items, model):
+        """ the related names of a row, checked like the api checks them """
+        if items is None:
+            return []
+        if not isinstance(items, list):
+            raise ValueError(f'expected a list of names, got {items!r}')
+        max_length = model._meta.get_field('name').max_length
+        names = []
+        for item in items:
+            name = item.get('name') if isinstance(item, dict) else item
+            if not isinstance(name, str) or not name.strip():
+                raise ValueError(f'invalid name {name!r}')
+            name = name.strip()
+            if len(name) > max_length:
+                raise ValueError(
+                    f'name longer than {max_length} characters: {name!r}'
+                )
+            names.append(name)
+        return names
+
+    def _user(self, email):
+        if email not in self.users:
+            try:
+                self.users[email] = get_user_model().objects.get(email=email)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'unknown user {email}')
+        return self.users[email]
+
+    def _build(self, row):
+        if isinstance(row, str):
+            row = json.loads(row)
+            if not isinstance(row, dict):
+                raise ValueError(f'expected an object, got {row!r}')
+        email = row.get('user') or self.default_user
+        if not email:
+            raise ValueError('no user given')
+        recipe = Recipe(
+            user=self._user(email),
+            title=row['title'],
+            time_minutes=int(row['time_minutes']),
+            price=Decimal(str(row['price'])),
+            description=row.get('description') or '',
+            link=row.get('link') or '',
+        )
+        recipe.clean_fields(exclude=['user', 'image'])
+        return (
+            recipe,
+            self._names(row.get('tags'), Tag),
+            self._names(row.get('ingredients'), Ingredient),
+        )
+
+    def _copy_links(self, field_name, links):
+        """ load freshly created recipe links with postgres COPY """
+        through, source, target = Recipe.objects.through_columns(field_name)
+        data = io.StringIO(''.join(f'{a}\t{b}\n' for a, b in links))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(through._meta.db_table)} '
+                f'({source}, {target}) FROM STDIN',
+                data,
+            )
+
+    @transaction.atomic
+    def _import_batch(self, batch):
+        recipes = Recipe.objects.bulk_create([item[0] for item in batch])
+        for field_name, index in (('tags', 1), ('ingredients', 2)):
+            names = [item[index] for item in batch]
+            if self.use_copy:
+                self._copy_links(
+                    field_name,
+                    Recipe.objects.resolve_links(field_name, recipes, names),
+                )
+            else:
+                Recipe.objects.link_names(field_name, recipes, names)
+        for user_id in {recipe.user_id for recipe in recipes}:
+            RecipeCollectionVersion.objects.bump(user_id)
+        return len(recipes)
+
+    def handle(self, *args: Any, **options: Any):
+        path = options['path']
+        input_format = options['input_format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson'
+        )
+        self.default_user = options['user']
+        self.users = {}
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if path == '-':
+            stream = options.get('stdin') or sys.stdin
+        else:
+            stream = open(path, newline='', encoding='utf-8')
+
+        imported = skipped = 0
+        started = time.monotonic()
+        try:
+            rows = enumerate(self._rows(stream, input_format), start=1)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                batch = []
+                for line_number, row in chunk:
+                    try:
+                        batch.append(self._build(row))
+                    except (AttributeError, KeyError, TypeError, ValueError,
+                            InvalidOperation, ValidationError) as exc:
+                        skipped += 1
+                        self.stderr.write(f'row {line_number}: {exc!r}')
+                if batch:
+                    imported += self._import_batch(batch)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'{imported} recipes '
+                        f'({imported / max(elapsed, 1e-9):.0f} rows/sec)'
+                    )
+        finally:
+            if path != '-':
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes, skipped {skipped} rows '
+            f'in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/sec)'
+        ))
@@ -0,0 +1,45 @@
+"""
+Django command to render recipe images that have no renditions yet
+"""
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.images import process_recipe_image
+
+
+class Command(BaseCommand):
+    """Django command to render missing image renditions"""
+    help = (
+        'Render the renditions of recipe images that have none, such as '
+        'the ones queued in a process that stopped or whose job failed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report the images that would be rendered',
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        pending = Recipe.objects.filter(image_renditions={}).exclude(
+            image='',
+        ).exclude(image__isnull=True).order_by('id')
+        rendered = skipped = 0
+        for recipe_id, name in pending.values_list('id', 'image').iterator():
+            if options['dry_run']:
+                self.stdout.write(f'would render {name}')
+                rendered += 1
+            elif process_recipe_image(recipe_id, name):
+                self.stdout.write(f'rendered {name}')
+                rendered += 1
+            else:
+                # logged by process_recipe_image, or the image was replaced
+                self.stdout.write(f'skipped {name}', self.style.WARNING)
+                skipped += 1
+
+        action = 'Would render' if options['dry_run'] else 'Rendered'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {rendered} images, skipped {skipped}'
+        ))
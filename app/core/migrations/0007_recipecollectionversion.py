@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_versions(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    RecipeCollectionVersion = apps.get_model('core', 'RecipeCollectionVersion')
+    RecipeCollectionVersion.objects.bulk_create(
+        RecipeCollectionVersion(user_id=pk)
+        for pk in User.objects.values_list('pk', flat=True).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeCollectionVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_version', serialize=False, to='core.user')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
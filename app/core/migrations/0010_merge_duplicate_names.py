@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """ keep the oldest of each user's same-named tags and ingredients """
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeCollectionVersion = apps.get_model('core', 'RecipeCollectionVersion')
+    Tombstone = apps.get_model('core', 'Tombstone')
+    for model_name, field_name in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        target = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user_id', 'name').annotate(
+            keep=models.Min('id'), count=models.Count('id'),
+        ).filter(count__gt=1)
+        for row in duplicates.iterator():
+            others = list(model.objects.filter(
+                user_id=row['user_id'], name=row['name'],
+            ).exclude(id=row['keep']).values_list('id', flat=True))
+            recipe_ids = list(through.objects.filter(
+                **{f'{target}__in': others},
+            ).values_list('recipe_id', flat=True).distinct())
+            through.objects.bulk_create(
+                [through(recipe_id=pk, **{target: row['keep']})
+                 for pk in recipe_ids],
+                ignore_conflicts=True,
+            )
+            model.objects.filter(id__in=others).delete()
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                updated_at=timezone.now(),
+            )
+            Tombstone.objects.bulk_create(
+                Tombstone(
+                    user_id=row['user_id'], kind=model_name.lower(),
+                    object_id=pk,
+                )
+                for pk in others
+            )
+            RecipeCollectionVersion.objects.filter(
+                user_id=row['user_id'],
+            ).update(version=models.F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
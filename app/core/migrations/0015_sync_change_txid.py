@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:15
+
+from django.db import migrations, models
+
+TABLES = ('core_recipe', 'core_tag', 'core_ingredient', 'core_tombstone')
+
+# rows written before this migration keep a null txid: no cursor handed
+# out from now on is older than them, and full syncs still include them
+CREATE_FUNCTION = """
+CREATE FUNCTION core_set_change_txid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := txid_current();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def create_change_triggers(apps, schema_editor):
+    """ delta sync needs transaction ids, which only postgres exposes """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_FUNCTION)
+    for table in TABLES:
+        schema_editor.execute(
+            f'CREATE TRIGGER {table}_change_txid_trigger '
+            f'BEFORE INSERT OR UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE PROCEDURE core_set_change_txid()'
+        )
+
+
+def drop_change_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            f'DROP TRIGGER IF EXISTS {table}_change_txid_trigger ON {table}'
+        )
+    schema_editor.execute('DROP FUNCTION IF EXISTS core_set_change_txid()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='core_recipe_user_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tombstone',
+            name='core_tombst_user_id_868f13_idx',
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'change_txid'], name='core_recipe_user_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'change_txid'], name='core_tombst_user_id_a11e1f_idx'),
+        ),
+        migrations.RunPython(create_change_triggers, drop_change_triggers),
+    ]
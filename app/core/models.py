@@ -4,20 +4,64 @@ DataBase Models
 """
 import uuid
 import os
+import threading
+from contextlib import contextmanager
+
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity,
+)
+from django.db import connections, models, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     PermissionsMixin,
     BaseUserManager,
 )
 
+SEARCH_CONFIG = 'english'
+
+
+def has_trigram(connection):
+    """
+    whether the pg_trgm extension is installed in the connected database;
+    kept on the connection, which forgets it when it reconnects
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    supported = getattr(connection, 'trigram_support', None)
+    if supported is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            supported = cursor.fetchone() is not None
+        connection.trigram_support = supported
+    return supported
+
+
 def recipe_image_file_path(image, filename):
     ext = os.path.splitext(filename)[1]
     filename = f"{uuid.uuid4()}{ext}"
     return os.path.join("uploads", "recipe", filename)
 
-class UserManager(BaseUserManager):
+
+class UserQuerySet(models.QuerySet):
+
+    def delete(self):
+        # the users' rows go with them, so nothing is recorded for them
+        with batched_changes(deleting_users=self.values_list('pk', flat=True)):
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """Managers for User """
     def create_superuser(self, email, password, **extra_field):
         """ create new super user """
@@ -39,6 +83,235 @@ class UserManager(BaseUserManager):
         return user
 
 
+class BatchedDeleteQuerySet(models.QuerySet):
+    """ deletes record their tombstones and version bumps in one batch """
+
+    def delete(self):
+        with batched_changes():
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class RecipeQuerySet(BatchedDeleteQuerySet):
+    """QuerySet for recipes"""
+
+    def for_api(self):
+        """ prefetch the tags and ingredients rendered by the api """
+        return self.prefetch_related(
+            models.Prefetch(
+                'tags', queryset=Tag.objects.only('id', 'name').order_by('id'),
+            ),
+            models.Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.only('id', 'name').order_by('id'),
+            ),
+        )
+
+    def chunked(self, chunk_size=500):
+        """
+        iterate by descending id in keyset chunks, so memory stays bounded
+        while each chunk still gets its prefetches
+        """
+        queryset = self.order_by('-id')
+        last_id = None
+        while True:
+            chunk = queryset
+            if last_id is not None:
+                chunk = chunk.filter(id__lt=last_id)
+            recipes = list(chunk[:chunk_size])
+            if not recipes:
+                return
+            yield from recipes
+            last_id = recipes[-1].id
+
+    def through_columns(self, field_name):
+        """ the through model of an m2m field and its two id columns """
+        field = self.model._meta.get_field(field_name)
+        return (
+            field.remote_field.through,
+            f'{field.m2m_field_name()}_id',
+            f'{field.m2m_reverse_field_name()}_id',
+        )
+
+    def resolve_links(self, field_name, recipes, names):
+        """
+        resolve the related names of many recipes, creating missing objects
+        per user, and return the distinct (recipe id, related id) pairs
+        """
+        names = list(names)
+        by_user = {}
+        for recipe, recipe_names in zip(recipes, names):
+            by_user.setdefault(recipe.user, []).extend(recipe_names)
+        related_model = self.model._meta.get_field(field_name).related_model
+        resolved = {}
+        for user, user_names in by_user.items():
+            for obj in related_model.objects.get_or_create_many(
+                user, user_names,
+            ):
+                resolved[(user.id, obj.name)] = obj.id
+        return list(dict.fromkeys(
+            (recipe.id, resolved[(recipe.user.id, name)])
+            for recipe, recipe_names in zip(recipes, names)
+            for name in recipe_names
+        ))
+
+    def link_names(self, field_name, recipes, names):
+        """ resolve the related names of many recipes and link them """
+        through, source, target = self.through_columns(field_name)
+        through.objects.bulk_create(
+            [
+                through(**{source: recipe_id, target: related_id})
+                for recipe_id, related_id in self.resolve_links(
+                    field_name, recipes, names,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _filter_related(self, field_name, ids, match_all=False):
+        """ filter through the m2m table with EXISTS instead of a join """
+        through, source, target = self.through_columns(field_name)
+        links = through.objects.filter(**{source: models.OuterRef('pk')})
+        if match_all:
+            conditions = [
+                models.Exists(links.filter(**{target: pk}))
+                for pk in set(ids)
+            ]
+        else:
+            conditions = [
+                models.Exists(links.filter(**{f'{target}__in': ids})),
+            ]
+        return self.filter(*conditions)
+
+    def file_names(self):
+        """ storage names of the recipes' images and their renditions """
+        names = set()
+        rows = self.exclude(image='').exclude(image__isnull=True).values_list(
+            'image', 'image_renditions',
+        )
+        for image, renditions in rows.iterator():
+            names.add(image)
+            for formats in renditions.values():
+                names.update(formats.values())
+        return names
+
+    def touch(self):
+        """ mark the recipes as modified without loading them """
+        return self.update(updated_at=timezone.now())
+
+    def search(self, terms):
+        """
+        recipes matching the search terms, best first; on postgres this
+        ranks against the search vector, elsewhere it falls back to a
+        substring match ordered by recency
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                models.Q(title__icontains=terms) |
+                models.Q(description__icontains=terms)
+            ).order_by('-id')
+        query = SearchQuery(
+            terms, config=SEARCH_CONFIG, search_type='websearch',
+        )
+        return self.filter(search_vector=query).annotate(
+            search_rank=SearchRank(models.F('search_vector'), query),
+        ).order_by('-search_rank', '-id')
+
+    def with_tags(self, ids, match_all=False):
+        """ recipes having any (or all) of the given tags """
+        return self._filter_related('tags', ids, match_all)
+
+    def with_ingredients(self, ids, match_all=False):
+        """ recipes having any (or all) of the given ingredients """
+        return self._filter_related('ingredients', ids, match_all)
+
+
+class RecipeRelatedQuerySet(BatchedDeleteQuerySet):
+    """QuerySet for tags and ingredients"""
+
+    def for_api(self):
+        """ load only the columns rendered by the api """
+        return self.only('id', 'name', 'user')
+
+    def _links(self):
+        """ recipe links of the outer object, for correlated subqueries """
+        field = next(
+            field for field in Recipe._meta.many_to_many
+            if field.related_model is self.model
+        )
+        through, source, target = Recipe.objects.through_columns(field.name)
+        return through.objects.filter(**{target: models.OuterRef('pk')})
+
+    def assigned(self, assigned=True):
+        """ objects used (or, with assigned=False, unused) by a recipe """
+        exists = models.Exists(self._links())
+        return self.filter(exists if assigned else ~exists)
+
+    def with_usage_count(self):
+        """ annotate how many recipes use each object """
+        # a bare COUNT keeps the subquery ungrouped, so it yields one row
+        count = self._links().annotate(
+            count=models.Func(models.F('pk'), function='COUNT'),
+        ).values('count')
+        return self.annotate(usage_count=models.Subquery(
+            count, output_field=models.IntegerField(),
+        ))
+
+    def autocomplete(self, user, term, limit=10):
+        """
+        the user's objects whose name starts with or, with pg_trgm, looks
+        like the term; prefix matches first, then the closest names
+        """
+        queryset = self.filter(user=user)
+        if not has_trigram(connections[self.db]):
+            return queryset.filter(
+                name__istartswith=term,
+            ).order_by(Upper('name'), 'id')[:limit]
+        # both conditions are served by a trigram index on upper(name)
+        return queryset.annotate(upper_name=Upper('name')).filter(
+            models.Q(upper_name__startswith=term.upper()) |
+            models.Q(upper_name__trigram_similar=term.upper())
+        ).annotate(
+            is_prefix=models.Case(
+                models.When(upper_name__startswith=term.upper(), then=1),
+                default=0,
+                output_field=models.IntegerField(),
+            ),
+            similarity=TrigramSimilarity('upper_name', term.upper()),
+        ).order_by('-is_prefix', '-similarity', 'upper_name', 'id')[:limit]
+
+    def facets(self, recipes):
+        """ id, name and recipe count of the objects the recipes use """
+        return self.filter(recipe__in=recipes.values('id')).values(
+            'id', 'name',
+        ).annotate(
+            count=models.Count('recipe'),
+        ).order_by('-count', 'name', 'id')
+
+    def _by_name(self, user, names):
+        found = {}
+        for obj in self.filter(user=user, name__in=names).order_by('id'):
+            found.setdefault(obj.name, obj)
+        return found
+
+    def get_or_create_many(self, user, names):
+        """ fetch the user's objects by name, creating the missing ones """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+        found = self._by_name(user, names)
+        missing = [name for name in names if name not in found]
+        if missing:
+            self.bulk_create(
+                [self.model(user=user, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            found.update(self._by_name(user, missing))
+        return [found[name] for name in names]
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """ User Model in the System """
     email = models.EmailField(max_length=255, unique=True)
@@ -50,11 +323,17 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    def delete(self, *args, **kwargs):
+        with batched_changes(deleting_users=[self.pk]):
+            return super().delete(*args, **kwargs)
+
 
 class Recipe(models.Model):
+    # covered by the composite indexes below, which lead with the user
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     title = models.CharField(max_length=255)
     time_minutes = models.IntegerField()
@@ -64,6 +343,29 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # storage names of the resized copies of image, by size and format
+    image_renditions = models.JSONField(default=dict, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # the transaction that last wrote the row, set by a database trigger;
+    # delta sync compares it with the watermark it hands to clients
+    change_txid = models.BigIntegerField(null=True, editable=False)
+    # title (weight A) and description (weight B), kept current by a
+    # database trigger so bulk inserts and COPY are covered too
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the api lists a user's recipes newest first
+            models.Index(
+                fields=['user', '-id'], name='core_recipe_user_recent_idx',
+            ),
+            models.Index(
+                fields=['user', 'change_txid'],
+                name='core_recipe_user_change_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -71,10 +373,24 @@ class Recipe(models.Model):
 
 class Tag(models.Model):
     name = models.CharField(max_length=255)
+    # user lookups use the index of the (user, name) unique constraint
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_index=False,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # set by a database trigger, see Recipe.change_txid
+    change_txid = models.BigIntegerField(null=True, editable=False)
+
+    objects = RecipeRelatedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='core_tag_user_name_uniq',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -82,10 +398,183 @@ class Tag(models.Model):
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=255)
+    # user lookups use the index of the (user, name) unique constraint
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_index=False,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # set by a database trigger, see Recipe.change_txid
+    change_txid = models.BigIntegerField(null=True, editable=False)
+
+    objects = RecipeRelatedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='core_ingredient_user_name_uniq',
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+_batches = threading.local()
+
+
+class ChangeBatch:
+    """
+    Tombstones and version bumps collected while many rows are deleted,
+    written with one query each when the batch ends. Nothing is kept for
+    users that are being deleted themselves.
+    """
+
+    def __init__(self):
+        self.tombstones = []
+        self.user_ids = set()
+        self.deleting_users = set()
+
+    @staticmethod
+    def current():
+        return getattr(_batches, 'batch', None)
+
+    def record(self, instance):
+        if instance.user_id not in self.deleting_users:
+            self.tombstones.append(Tombstone(
+                user_id=instance.user_id,
+                kind=instance._meta.model_name,
+                object_id=instance.pk,
+            ))
+
+    def bump(self, user_id):
+        if user_id not in self.deleting_users:
+            self.user_ids.add(user_id)
+
+    def flush(self):
+        tombstones = [
+            tombstone for tombstone in self.tombstones
+            if tombstone.user_id not in self.deleting_users
+        ]
+        if tombstones:
+            Tombstone.objects.bulk_create(tombstones)
+        user_ids = self.user_ids - self.deleting_users
+        if user_ids:
+            RecipeCollectionVersion.objects.filter(
+                user_id__in=user_ids,
+            ).update(version=models.F('version') + 1)
+
+
+@contextmanager
+def batched_changes(deleting_users=()):
+    """
+    collect the tombstones and version bumps of the block and write them
+    at its end, in the same transaction; nested blocks join the outer one
+    """
+    batch = ChangeBatch.current()
+    if batch is not None:
+        batch.deleting_users.update(deleting_users)
+        yield batch
+        return
+    batch = ChangeBatch()
+    batch.deleting_users.update(deleting_users)
+    _batches.batch = batch
+    try:
+        with transaction.atomic():
+            yield batch
+            _batches.batch = None
+            batch.flush()
+    finally:
+        _batches.batch = None
+
+
+class RecipeCollectionVersionQuerySet(models.QuerySet):
+    """QuerySet for recipe collection versions"""
+
+    def current(self, user_id):
+        """ the user's current version, None if the user has none """
+        return self.filter(user_id=user_id).values_list(
+            'version', flat=True,
+        ).first()
+
+    def bump(self, user_id):
+        """
+        move the user to a new version; runs in the caller's transaction
+        so readers never see the new version together with old data
+        """
+        batch = ChangeBatch.current()
+        if batch is not None:
+            batch.bump(user_id)
+            return
+        self.filter(user_id=user_id).update(version=models.F('version') + 1)
+
+
+class RecipeCollectionVersion(models.Model):
+    """ per user counter bumped on every change to the user's recipe data """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_version',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = RecipeCollectionVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.user_id}:{self.version}'
+
+
+class TombstoneQuerySet(models.QuerySet):
+    """QuerySet for tombstones"""
+
+    def record(self, instance):
+        """ remember that a recipe, tag or ingredient was deleted """
+        batch = ChangeBatch.current()
+        if batch is not None:
+            batch.record(instance)
+            return None
+        return self.create(
+            user_id=instance.user_id,
+            kind=instance._meta.model_name,
+            object_id=instance.pk,
+        )
+
+    def since(self, user, txid):
+        """ ids of the user's objects deleted from transaction `txid` on """
+        deleted = {kind: [] for kind, _ in Tombstone.KIND_CHOICES}
+        rows = self.filter(user=user, change_txid__gte=txid).order_by('id')
+        for kind, object_id in rows.values_list('kind', 'object_id'):
+            deleted[kind].append(object_id)
+        return deleted
+
+
+class Tombstone(models.Model):
+    """ a deleted recipe, tag or ingredient, kept for delta sync clients """
+    KIND_CHOICES = [
+        ('recipe', 'Recipe'),
+        ('tag', 'Tag'),
+        ('ingredient', 'Ingredient'),
+    ]
+    # no database constraint, so cascading a user delete can still insert
+    # tombstones for the user's rows; they are removed with the user
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    # set by a database trigger, see Recipe.change_txid
+    change_txid = models.BigIntegerField(null=True, editable=False)
+
+    objects = TombstoneQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_txid'])]
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}'
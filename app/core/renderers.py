@@ -0,0 +1,38 @@
+"""
+JSON renderer backed by orjson, falling back to DRF's stdlib renderer
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetimes go through DRF's encoder so they are formatted the same
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Render the same compact JSON as JSONRenderer through orjson. Types
+    orjson doesn't know, such as Decimal, go through DRF's encoder.
+    Indented output and installs without orjson use JSONRenderer.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact or (
+            self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(
+            data, default=self.encoder.default, option=ORJSON_OPTIONS,
+        )
+        # escaped like JSONRenderer, so the output is valid javascript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029',
+        )
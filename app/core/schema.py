@@ -0,0 +1,125 @@
+"""
+OpenAPI schema generated once per process and served from memory
+"""
+import gzip
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+logger = logging.getLogger(__name__)
+
+
+def accepts_gzip(accept_encoding):
+    """ whether an Accept-Encoding header allows gzip, q=0 refuses it """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = coding.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+class SchemaDocument:
+    """ one rendering of the schema with its ETag and gzip copy """
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+        self.gzipped = gzip.compress(content, 9, mtime=0)
+        self.etag = quote_etag(hashlib.sha256(content).hexdigest()[:32])
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """
+    Serve the schema from API_SCHEMA_FILE, written at deploy by
+    `manage.py spectacular --format openapi-json`, or else from a schema
+    generated on the first request. Either way it is rendered once per
+    format and process; ?lang= requests are still generated each time.
+    """
+    _schema = None
+    _documents = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._lock:
+            cls._schema = None
+            cls._documents = {}
+
+    def _load_schema(self):
+        path = getattr(settings, 'API_SCHEMA_FILE', None)
+        if path:
+            try:
+                with open(path, 'rb') as schema_file:
+                    return json.load(schema_file)
+            except FileNotFoundError:
+                logger.warning('%s missing, generating the schema', path)
+        generator = self.generator_class(
+            urlconf=self.urlconf, api_version=self.api_version,
+        )
+        return generator.get_schema(request=None, public=self.serve_public)
+
+    def _document(self, renderer):
+        key = type(renderer)
+        document = self._documents.get(key)
+        if document is None:
+            with self._lock:
+                if CachedSchemaView._schema is None:
+                    CachedSchemaView._schema = self._load_schema()
+                content_type = renderer.media_type
+                if renderer.charset:
+                    content_type += f'; charset={renderer.charset}'
+                content = renderer.render(
+                    CachedSchemaView._schema, renderer_context={},
+                )
+                document = SchemaDocument(content, content_type)
+                CachedSchemaView._documents = {
+                    **self._documents, key: document,
+                }
+        return document
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if settings.USE_I18N and request.GET.get('lang'):
+            return super().get(request, *args, **kwargs)
+        document = self._document(request.accepted_renderer)
+        gzipped = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        # the gzip body is another representation, so its tag is weak
+        etag = f'W/{document.etag}' if gzipped else document.etag
+        if_none_match = {
+            tag.replace('W/', '', 1)
+            for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        }
+        if document.etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        elif gzipped:
+            response = HttpResponse(
+                document.gzipped, content_type=document.content_type,
+            )
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                document.content, content_type=document.content_type,
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
@@ -0,0 +1,93 @@
+"""
+Content addressed file storage
+"""
+import gzip
+import hashlib
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def content_digest(content):
+    """ sha256 of a file, read chunk by chunk """
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Store files under the sha256 of their content, keeping the directory
+    and extension of the requested name.
+
+    Identical uploads share one file, and a name never changes content,
+    so it can be cached forever. Files may be shared between rows, so
+    they are only removed by the gc_media command once nothing uses them.
+    """
+
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = content_digest(content)
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # a fresh mtime keeps gc_media from collecting a reused file
+            # before the row referencing it is committed
+            os.utime(self.path(name))
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # another upload of the same content won the race
+            super().delete(saved)
+        return name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes gzip (and, with the brotli package,
+    brotli) copies of the hashed text assets for the proxy to serve as is.
+    """
+    compressible_extensions = (
+        '.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml',
+        '.ico', '.ttf', '.eot', '.otf',
+    )
+    min_compress_size = 256
+
+    def _compressors(self):
+        yield '.gz', lambda data: gzip.compress(data, 9, mtime=0)
+        if brotli is not None:
+            yield '.br', lambda data: brotli.compress(data)
+
+    def compress(self, name):
+        """ write the compressed copies that are smaller than the file """
+        if not name.lower().endswith(self.compressible_extensions):
+            return
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < self.min_compress_size:
+            return
+        for suffix, compress in self._compressors():
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        if not kwargs.get('dry_run'):
+            for hashed_name in set(self.hashed_files.values()):
+                self.compress(self.clean_name(hashed_name))
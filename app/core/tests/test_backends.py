@@ -0,0 +1,76 @@
+"""
+Test the database backend
+"""
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+
+
+class TestHealthChecks(TestCase):
+
+    def _connection(self, health_checks=True):
+        conn = connection.copy()
+        conn.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+        conn.health_check_enabled = health_checks
+        self.addCleanup(conn.close)
+        return conn
+
+    def _drop_server_side(self, conn):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(%s)',
+                [conn.connection.get_backend_pid()],
+            )
+
+    def test_reconnects_after_dropped_connection(self):
+        conn = self._connection()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self._drop_server_side(conn)
+
+        conn.close_if_unusable_or_obsolete()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_checks_once_per_request(self):
+        conn = self._connection()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = conn.connection
+
+        with patch.object(
+            conn, 'is_usable', wraps=conn.is_usable,
+        ) as is_usable:
+            for _ in range(3):
+                # request_started and request_finished call this on
+                # every connection
+                conn.close_if_unusable_or_obsolete()
+                for _ in range(3):
+                    with conn.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                conn.close_if_unusable_or_obsolete()
+
+        self.assertEqual(is_usable.call_count, 3)
+        self.assertIs(conn.connection, raw)
+
+    def test_no_check_when_disabled(self):
+        conn = self._connection(health_checks=False)
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.close_if_unusable_or_obsolete()
+
+        with conn.cursor():
+            pass
+        self.assertFalse(conn.health_check_done)
+
+    def test_trigram_support_forgotten_on_reconnect(self):
+        conn = self._connection()
+        conn.ensure_connection()
+        conn.trigram_support = True
+
+        conn.close()
+        conn.ensure_connection()
+
+        self.assertIsNone(conn.trigram_support)
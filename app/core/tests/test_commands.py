@@ -1,3 +1,8 @@
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
@@ -6,7 +11,10 @@ from django.core.management import call_command
 
 from django.db.utils import OperationalError
 
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth import get_user_model
+
+from core.models import Recipe, Tag
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -29,3 +37,91 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 6)
 
         patched_check.assert_called_with(databases=["default"])
+
+
+class ImportRecipesCommandTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com', '12345test',
+        )
+
+    def test_import_ndjson_from_stdin(self):
+        Tag.objects.create(user=self.user, name='tag1')
+        rows = [
+            {
+                'title': f'recipe{i}',
+                'price': '5.50',
+                'time_minutes': i,
+                'tags': [{'name': 'tag1'}, 'tag2'],
+                'ingredients': ['ing1'],
+            }
+            for i in range(5)
+        ]
+        stdin = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+        out = io.StringIO()
+
+        call_command(
+            'import_recipes', '-', user=self.user.email, batch_size=2,
+            stdin=stdin, stdout=out,
+        )
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        for recipe in recipes:
+            self.assertEqual(recipe.price, Decimal('5.50'))
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+        self.assertIn('Imported 5 recipes', out.getvalue())
+
+    def test_import_ndjson_skips_invalid_rows(self):
+        good = {'title': 'good', 'price': '1.00', 'time_minutes': 3}
+        lines = [
+            json.dumps({**good, 'tags': ['  spaced  ']}),
+            '{"title": "truncated"',
+            json.dumps({**good, 'tags': 'abc'}),
+            json.dumps({**good, 'tags': ['ok', ' ']}),
+            json.dumps({**good, 'ingredients': ['x' * 256]}),
+            json.dumps([good]),
+        ]
+        stdin = io.StringIO(''.join(line + '\n' for line in lines))
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command(
+            'import_recipes', '-', user=self.user.email,
+            stdin=stdin, stdout=out, stderr=err,
+        )
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(
+            list(recipe.tags.values_list('name', flat=True)), ['spaced'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertIn('Imported 1 recipes, skipped 5 rows', out.getvalue())
+        for row in range(2, 7):
+            self.assertIn(f'row {row}:', err.getvalue())
+
+    def test_import_csv_file_skips_invalid_rows(self):
+        content = (
+            'user,title,price,time_minutes,tags\n'
+            f'{self.user.email},good,1.00,3,a|b\n'
+            f'{self.user.email},bad,not-a-price,3,\n'
+        )
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False,
+        ) as csv_file:
+            csv_file.write(content)
+        self.addCleanup(os.remove, csv_file.name)
+        err = io.StringIO()
+
+        call_command(
+            'import_recipes', csv_file.name, no_copy=True,
+            stdout=io.StringIO(), stderr=err,
+        )
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'good')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)), ['a', 'b'],
+        )
+        self.assertIn('row 2', err.getvalue())
@@ -0,0 +1,89 @@
+"""
+Test that the api's hot queries are served by indexes
+"""
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'postgres plans')
+class TestQueryPlans(TestCase):
+    """ run EXPLAIN for the hot queries against a seeded dataset """
+    users = 20
+    recipes_per_user = 300
+    names_per_user = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            get_user_model().objects.create_user(f'user{i}@example.com', 'pw')
+            for i in range(cls.users)
+        ]
+        cls.user = users[0]
+        Recipe.objects.bulk_create(
+            Recipe(
+                user=user, title=f'recipe {i}', time_minutes=i % 60,
+                price=Decimal('5.00'), description=f'step {i} ' * 20,
+            )
+            for user in users for i in range(cls.recipes_per_user)
+        )
+        for model in (Tag, Ingredient):
+            model.objects.bulk_create(
+                model(user=user, name=f'name {i}')
+                for user in users for i in range(cls.names_per_user)
+            )
+        with connection.cursor() as cursor:
+            for model in (Recipe, Tag, Ingredient):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_recipe_list_uses_user_recent_index(self):
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        self.assertUsesIndex(queryset[:101], 'core_recipe_user_recent_idx')
+        self.assertNotIn('Seq Scan', queryset.explain())
+
+    def test_recipe_changes_use_user_change_index(self):
+        since = Recipe.objects.aggregate(txid=Max('change_txid'))['txid'] + 1
+        queryset = Recipe.objects.filter(
+            user=self.user, change_txid__gte=since,
+        ).order_by('id')
+
+        self.assertUsesIndex(queryset, 'core_recipe_user_change_idx')
+
+    def test_related_list_uses_user_name_index(self):
+        for model in (Tag, Ingredient):
+            queryset = model.objects.filter(
+                user=self.user,
+            ).order_by('-name', '-id')[:101]
+
+            self.assertUsesIndex(
+                queryset, f'core_{model._meta.model_name}_user_name_uniq',
+            )
+
+    def test_related_lookup_by_name_uses_user_name_index(self):
+        for model in (Tag, Ingredient):
+            queryset = model.objects.filter(
+                user=self.user, name__in=['name 1', 'name 2'],
+            )
+
+            self.assertUsesIndex(
+                queryset, f'core_{model._meta.model_name}_user_name_uniq',
+            )
+
+    def test_recipe_search_uses_gin_index(self):
+        # a single user's recipes may be cheaper to scan by user, so check
+        # the index serves the match across all users
+        queryset = Recipe.objects.search('soup')
+
+        self.assertUsesIndex(queryset, 'core_recipe_search_vector_idx')
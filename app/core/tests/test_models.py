@@ -103,3 +103,38 @@ class TestModels(TestCase):
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
         self.assertEqual(file_path, f"uploads/recipe/{uuid}.jpg")
+
+    def test_recipe_updated_at_touched_by_link_changes(self):
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='recipe title',
+            price=Decimal('5.50'),
+            time_minutes=5,
+        )
+        tag = models.Tag.objects.create(user=user, name='tag1')
+        before = recipe.updated_at
+
+        recipe.tags.add(tag)
+        recipe.refresh_from_db()
+
+        self.assertGreater(recipe.updated_at, before)
+
+    def test_recipe_updated_at_touched_by_reverse_clear(self):
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='recipe title',
+            price=Decimal('5.50'),
+            time_minutes=5,
+        )
+        ingredient = models.Ingredient.objects.create(user=user, name='salt')
+        recipe.ingredients.add(ingredient)
+        recipe.refresh_from_db()
+        before = recipe.updated_at
+
+        ingredient.recipe_set.clear()
+        recipe.refresh_from_db()
+
+        self.assertGreater(recipe.updated_at, before)
+        self.assertFalse(hasattr(ingredient, '_cleared_recipe_ids'))
@@ -0,0 +1,86 @@
+"""
+Test the orjson backed renderer and parser
+"""
+import io
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+PAYLOAD = {
+    'results': [
+        OrderedDict([
+            ('id', 1),
+            ('title', 'Crème brûlée\u2028line'),
+            ('price', Decimal('5.50')),
+            ('cost', Decimal('3')),
+            ('ratio', 0.1),
+            ('tags', [{'id': 2, 'name': 'dessert'}]),
+            ('link', None),
+            ('ok', True),
+        ]),
+    ],
+    'created': datetime(2021, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'day': date(2021, 5, 1),
+    'at': time(12, 30, 15, 123456),
+    'uuid': uuid.UUID(int=1),
+    'label': _('Upload a valid image.'),
+    'counts': {1: 'one'},
+    'names': ('a', 'b'),
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def assertSameAsJSONRenderer(self, data, *args):
+        self.assertEqual(
+            FastJSONRenderer().render(data, *args),
+            JSONRenderer().render(data, *args),
+        )
+
+    def test_same_output_as_json_renderer(self):
+        self.assertSameAsJSONRenderer(PAYLOAD)
+        self.assertSameAsJSONRenderer([])
+        self.assertSameAsJSONRenderer(None)
+
+    def test_indented_output_uses_json_renderer(self):
+        self.assertSameAsJSONRenderer(PAYLOAD, 'application/json; indent=2')
+
+    def test_without_orjson(self):
+        with patch('core.renderers.orjson', None):
+            self.assertSameAsJSONRenderer(PAYLOAD)
+
+
+class FastJSONParserTests(SimpleTestCase):
+
+    def _parse(self, body, encoding='utf-8', parser=None):
+        parser = parser or FastJSONParser()
+        return parser.parse(
+            io.BytesIO(body), 'application/json', {'encoding': encoding},
+        )
+
+    def test_parse(self):
+        body = '{"title": "Crème", "price": "5.50", "tags": [1, 2]}'.encode()
+
+        self.assertEqual(
+            self._parse(body), self._parse(body, parser=JSONParser()),
+        )
+
+    def test_parse_error(self):
+        with self.assertRaisesMessage(ParseError, 'JSON parse error'):
+            self._parse(b'{"title": ')
+
+    def test_other_encodings_use_json_parser(self):
+        body = '{"title": "Crème"}'.encode('latin-1')
+
+        self.assertEqual(self._parse(body, 'latin-1'), {'title': 'Crème'})
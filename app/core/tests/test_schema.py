@@ -0,0 +1,98 @@
+"""
+Test the cached OpenAPI schema view
+"""
+import gzip
+import json
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+
+from core.schema import CachedSchemaView
+
+SCHEMA_URL = reverse('api-schema')
+JSON = 'application/vnd.oai.openapi+json'
+
+
+class CachedSchemaViewTests(SimpleTestCase):
+
+    def setUp(self):
+        CachedSchemaView.clear_cache()
+        self.addCleanup(CachedSchemaView.clear_cache)
+
+    def test_schema_generated_once(self):
+        with patch.object(
+            SchemaGenerator, 'get_schema', autospec=True,
+            side_effect=SchemaGenerator.get_schema,
+        ) as get_schema:
+            first = self.client.get(SCHEMA_URL)
+            second = self.client.get(SCHEMA_URL)
+            as_json = self.client.get(SCHEMA_URL, HTTP_ACCEPT=JSON)
+
+        self.assertEqual(get_schema.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn(b'openapi: 3.0.3', first.content)
+        self.assertEqual(as_json['Content-Type'], JSON)
+        paths = json.loads(as_json.content)['paths']
+        self.assertIn('/api/recipe/recipes/', paths)
+        self.assertNotEqual(first['ETag'], as_json['ETag'])
+
+    def test_matching_etag_not_modified(self):
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+
+    def test_gzip_when_accepted(self):
+        plain = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertEqual(res['ETag'], f'W/{plain["ETag"]}')
+        not_modified = self.client.get(
+            SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_gzip_refused_with_zero_quality(self):
+        for accept_encoding in ('gzip;q=0', 'br, gzip; q=0.0', '*;q=0', 'br'):
+            res = self.client.get(
+                SCHEMA_URL, HTTP_ACCEPT_ENCODING=accept_encoding,
+            )
+
+            self.assertFalse(res.has_header('Content-Encoding'))
+        for accept_encoding in ('gzip;q=0.5', 'br;q=0, *', 'GZIP'):
+            res = self.client.get(
+                SCHEMA_URL, HTTP_ACCEPT_ENCODING=accept_encoding,
+            )
+
+            self.assertEqual(res['Content-Encoding'], 'gzip')
+
+    def test_schema_served_from_file(self):
+        schema = {'openapi': '3.0.3', 'info': {'title': 'deployed'}}
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as schema_file:
+            json.dump(schema, schema_file)
+            schema_file.flush()
+            with override_settings(API_SCHEMA_FILE=schema_file.name), \
+                    patch.object(SchemaGenerator, 'get_schema') as get_schema:
+                res = self.client.get(SCHEMA_URL, HTTP_ACCEPT=JSON)
+
+        get_schema.assert_not_called()
+        self.assertEqual(json.loads(res.content), schema)
+
+    def test_missing_file_falls_back_to_generation(self):
+        with override_settings(API_SCHEMA_FILE='/nonexistent/schema.json'), \
+                self.assertLogs('core.schema', 'WARNING'):
+            res = self.client.get(SCHEMA_URL, HTTP_ACCEPT=JSON)
+
+        self.assertIn('paths', json.loads(res.content))
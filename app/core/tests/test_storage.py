@@ -0,0 +1,191 @@
+"""
+Test content addressed storage, compressed static files and media
+garbage collection
+"""
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import storage as core_storage
+from core.models import Recipe
+from core.storage import ContentAddressedStorage
+
+
+class StorageTestCase(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+
+class ContentAddressedStorageTests(StorageTestCase):
+
+    def test_save_names_file_by_content(self):
+        storage = ContentAddressedStorage()
+        digest = hashlib.sha256(b'data').hexdigest()
+
+        name = storage.save('uploads/recipe/photo.JPG', ContentFile(b'data'))
+
+        self.assertEqual(name, f'uploads/recipe/{digest[:2]}/{digest}.jpg')
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'data')
+
+    def test_identical_content_stored_once(self):
+        storage = ContentAddressedStorage()
+
+        first = storage.save('uploads/recipe/a.jpg', ContentFile(b'data'))
+        second = storage.save('uploads/recipe/b.jpg', ContentFile(b'data'))
+        other = storage.save('uploads/recipe/c.jpg', ContentFile(b'other'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        directory = os.path.dirname(storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_reused_file_gets_fresh_mtime(self):
+        storage = ContentAddressedStorage()
+        name = storage.save('uploads/recipe/a.jpg', ContentFile(b'data'))
+        os.utime(storage.path(name), (0, 0))
+
+        storage.save('uploads/recipe/b.jpg', ContentFile(b'data'))
+
+        self.assertGreater(os.path.getmtime(storage.path(name)), 0)
+
+
+class CompressedManifestStaticFilesStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.root = tempfile.TemporaryDirectory()
+        self.css = 'body { color: red; }\n' * 50
+        with open(os.path.join(self.source.name, 'site.css'), 'w') as f:
+            f.write(self.css)
+        with open(os.path.join(self.source.name, 'tiny.css'), 'w') as f:
+            f.write('a {}')
+        with open(os.path.join(self.source.name, 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG' * 100)
+        self.settings_override = override_settings(
+            STATIC_ROOT=self.root.name,
+            STATICFILES_DIRS=[self.source.name],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ],
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'
+            ),
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.source.cleanup()
+        self.root.cleanup()
+
+    def _collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return set(os.listdir(self.root.name))
+
+    def _hashed(self, files, name):
+        stem, extension = os.path.splitext(name)
+        return next(
+            f for f in files
+            if f.startswith(stem + '.') and f.endswith(extension)
+            and f != name
+        )
+
+    def test_hashed_assets_get_gzip_copy(self):
+        files = self._collect()
+        hashed = self._hashed(files, 'site.css')
+
+        self.assertIn(hashed + '.gz', files)
+        with gzip.open(os.path.join(self.root.name, hashed + '.gz')) as f:
+            self.assertEqual(f.read().decode(), self.css)
+
+    def test_small_and_binary_files_not_compressed(self):
+        files = self._collect()
+
+        self.assertNotIn(self._hashed(files, 'tiny.css') + '.gz', files)
+        self.assertNotIn(self._hashed(files, 'logo.png') + '.gz', files)
+
+    @unittest.skipIf(core_storage.brotli is None, 'brotli not installed')
+    def test_hashed_assets_get_brotli_copy(self):
+        files = self._collect()
+        hashed = self._hashed(files, 'site.css')
+
+        self.assertIn(hashed + '.br', files)
+        with open(os.path.join(self.root.name, hashed + '.br'), 'rb') as f:
+            compressed = f.read()
+        self.assertEqual(
+            core_storage.brotli.decompress(compressed).decode(), self.css,
+        )
+
+
+class GcMediaCommandTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user('test@example.com', 'pw')
+        self.recipe = Recipe.objects.create(
+            user=user, title='recipe', time_minutes=5, price=Decimal('5.00'),
+        )
+
+    def _save(self, content, age=7200):
+        name = default_storage.save(
+            'uploads/recipe/x.jpg', ContentFile(content),
+        )
+        past = time.time() - age
+        os.utime(default_storage.path(name), (past, past))
+        return name
+
+    def _gc(self, *args):
+        out = io.StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_gc_deletes_only_unreferenced_files(self):
+        image = self._save(b'image')
+        rendition = self._save(b'rendition')
+        orphan = self._save(b'orphan')
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image=image, image_renditions={'small': {'webp': rendition}},
+        )
+
+        output = self._gc()
+
+        self.assertTrue(default_storage.exists(image))
+        self.assertTrue(default_storage.exists(rendition))
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertIn('Deleted 1 files', output)
+
+    def test_gc_keeps_recent_files(self):
+        recent = self._save(b'recent', age=10)
+
+        self._gc()
+
+        self.assertTrue(default_storage.exists(recent))
+
+    def test_gc_dry_run(self):
+        orphan = self._save(b'orphan')
+
+        output = self._gc('--dry-run')
+
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertIn(f'would delete {orphan}', output)
+        self.assertNotIn(f'deleted {orphan}', output)
+        self.assertIn('Would delete 1 files', output)
@@ -0,0 +1,74 @@
+"""
+Per user response caching for the recipe api
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import RecipeCollectionVersion
+
+
+class ResponseCache:
+    """ cache of rendered response data keyed on the collection version """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_RESPONSE_CACHE['ALIAS']]
+
+    def etag(self, request, version):
+        parts = [
+            self.prefix,
+            str(request.user.id),
+            str(version),
+            request.accepted_media_type or '',
+            request.get_full_path(),
+        ]
+        digest = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+        return quote_etag(digest)
+
+    def not_modified(self, request, etag):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    def get(self, etag):
+        return self.cache.get(f'{self.prefix}:{etag}')
+
+    def set(self, etag, data):
+        self.cache.set(
+            f'{self.prefix}:{etag}', data,
+            settings.RECIPE_RESPONSE_CACHE['TIMEOUT'],
+        )
+
+    def cached_response(self, request, build):
+        """
+        the response of build(), cached until the user's collection
+        changes and answered with a 304 when the client has it already;
+        responses other than a 200 are passed on uncached
+        """
+        version = RecipeCollectionVersion.objects.current(request.user.id)
+        if version is None:
+            return build()
+        etag = self.etag(request, version)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if self.not_modified(request, etag):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers,
+            )
+        data = self.get(etag)
+        if data is None:
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            self.set(etag, data)
+        return Response(data, headers=headers)
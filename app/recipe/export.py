@@ -0,0 +1,46 @@
+"""
+Streaming export of recipes as NDJSON or CSV
+"""
+import csv
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from recipe.serializers import DetailRecipeSerializer
+
+CSV_FIELDS = [
+    'id', 'title', 'price', 'time_minutes', 'link', 'description',
+    'tags', 'ingredients',
+]
+CSV_LIST_SEPARATOR = '|'
+
+
+class _Echo:
+    """ file-like object whose write returns the value for streaming """
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(recipes):
+    for recipe in recipes:
+        data = DetailRecipeSerializer(recipe).data
+        yield json.dumps(data, cls=JSONEncoder) + '\n'
+
+
+def iter_csv(recipes):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for recipe in recipes:
+        data = DetailRecipeSerializer(recipe).data
+        for name in ('tags', 'ingredients'):
+            data[name] = CSV_LIST_SEPARATOR.join(
+                item['name'] for item in data[name]
+            )
+        yield writer.writerow([data[field] for field in CSV_FIELDS])
+
+
+EXPORTERS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
@@ -0,0 +1,164 @@
+"""
+Background generation of resized recipe image renditions
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+from core.models import Recipe, RecipeCollectionVersion
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'recipe.images.ThreadPoolBackend',
+    'WORKERS': 2,
+    'SIZES': {'small': 320, 'medium': 1024},
+    'JPEG_QUALITY': 85,
+    'WEBP_QUALITY': 80,
+    'MAX_UPLOAD_SIZE': 10 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,
+}
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def image_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_IMAGES', {})}
+
+
+def rendition_name(name, label, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, 'renditions', f'{stem}-{label}.{extension}',
+    )
+
+
+def _encode(image, image_format, options):
+    # nothing but the pixels is passed to save, which drops exif, xmp and
+    # icc metadata from the source
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=options['JPEG_QUALITY'], optimize=True,
+        )
+    else:
+        image.save(buffer, 'WEBP', quality=options['WEBP_QUALITY'])
+    return buffer.getvalue()
+
+
+def render(name):
+    """ write the renditions of a stored image, returning their names """
+    options = image_options()
+    with default_storage.open(name) as image_file:
+        source = ImageOps.exif_transpose(Image.open(image_file))
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'A' in source.mode else 'RGB')
+        renditions = {}
+        for label, size in options['SIZES'].items():
+            image = source.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            renditions[label] = {
+                extension: default_storage.save(
+                    rendition_name(name, label, extension),
+                    ContentFile(_encode(image, image_format, options)),
+                )
+                for extension, image_format in FORMATS.items()
+            }
+    return renditions
+
+
+def process_recipe_image(recipe_id, name):
+    """
+    render the recipe's image and record the renditions, unless the
+    recipe got another image in the meantime; whether they were recorded
+    """
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id, image=name).only(
+            'id', 'user_id',
+        ).first()
+        if recipe is None:
+            return False
+        renditions = render(name)
+        with transaction.atomic():
+            updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+                image_renditions=renditions, updated_at=timezone.now(),
+            )
+            if updated:
+                RecipeCollectionVersion.objects.bump(recipe.user_id)
+        return bool(updated)
+    except Exception:
+        logger.exception('rendering image %s of recipe %s', name, recipe_id)
+        return False
+
+
+class SyncBackend:
+    """ process images in the request thread """
+
+    def enqueue(self, recipe_id, name):
+        process_recipe_image(recipe_id, name)
+
+
+class ThreadPoolBackend:
+    """
+    process images on a pool of threads in the web process; jobs still
+    queued when the process stops are lost, the render_images command
+    picks them up again
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # created lazily so forked workers don't share one
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=image_options()['WORKERS'],
+                    thread_name_prefix='recipe-images',
+                )
+            return self._executor
+
+    def _run(self, recipe_id, name):
+        close_old_connections()
+        try:
+            process_recipe_image(recipe_id, name)
+        finally:
+            close_old_connections()
+
+    def enqueue(self, recipe_id, name):
+        self.executor.submit(self._run, recipe_id, name)
+
+
+_backends = {}
+
+
+def get_backend():
+    """
+    the configured backend; another queue plugs in through any class
+    with an enqueue(recipe_id, name) method
+    """
+    path = image_options()['BACKEND']
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def schedule_renditions(recipe):
+    """ render the recipe's new image once the upload is committed """
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_backend().enqueue(recipe_id, name)
+    )
@@ -0,0 +1,43 @@
+"""
+Cursor pagination for the recipe api
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset pagination enabled when the client asks for a page.
+
+    Requests without a `cursor` or `page_size` parameter keep getting the
+    plain list response.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (self.cursor_query_param not in params and
+                self.page_size_query_param not in params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response_schema(self, schema):
+        """ a page, or the plain list when no page was asked for """
+        return {
+            'oneOf': [super().get_paginated_response_schema(schema), schema],
+        }
+
+
+class RecipeCursorPagination(OptionalCursorPagination):
+    """ search results keep their rank order and are not paginated """
+    ordering = '-id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('search'):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeRelatedCursorPagination(OptionalCursorPagination):
+    ordering = ('-name', '-id')
@@ -1,5 +1,12 @@
+import functools
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-from core.models import Recipe, Tag, Ingredient
+from core.models import Recipe, Tag, Ingredient, RecipeCollectionVersion
+from recipe.images import schedule_renditions
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -18,50 +25,127 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_field = ['id']
 
 
+class IngredientUsageSerializer(IngredientSerializer):
+    usage_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['usage_count']
+
+
+class TagUsageSerializer(TagSerializer):
+    usage_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['usage_count']
+
+
+def _names(items):
+    return [item['name'] for item in items]
+
+
+def rendition_urls(renditions, request=None):
+    """ urls of the image renditions, by size and format """
+    urls = {}
+    for label, names in renditions.items():
+        urls[label] = {}
+        for extension, name in names.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[label][extension] = url
+    return urls
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class RenditionsField(serializers.Field):
+    """ urls of the image renditions, by size and format """
+
+    def to_representation(self, value):
+        return rendition_urls(value, self.context.get('request'))
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """ create and update many recipes with bulk queries """
+
+    def _reload(self, recipes):
+        ids = [recipe.id for recipe in recipes]
+        by_id = Recipe.objects.filter(id__in=ids).for_api().in_bulk()
+        return [by_id[pk] for pk in ids]
+
+    @transaction.atomic
+    def create(self, validated_data):
+        tags = [item.pop('tags', []) for item in validated_data]
+        ingredients = [item.pop('ingredients', []) for item in validated_data]
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**item) for item in validated_data]
+        )
+        for user_id in {recipe.user_id for recipe in recipes}:
+            RecipeCollectionVersion.objects.bump(user_id)
+        Recipe.objects.link_names('tags', recipes, map(_names, tags))
+        Recipe.objects.link_names(
+            'ingredients', recipes, map(_names, ingredients),
+        )
+        return self._reload(recipes)
+
+    @transaction.atomic
+    def update(self, instances, validated_data):
+        recipes = [
+            self.child.update(instance, attrs)
+            for instance, attrs in zip(instances, validated_data)
+        ]
+        return self._reload(recipes)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_renditions = RenditionsField(read_only=True)
     class Meta:
         model = Recipe
-        fields = ['id', 'title', 'price', 'time_minutes', 'link', 'tags', 'ingredients']
+        fields = [
+            'id', 'title', 'price', 'time_minutes', 'link', 'tags',
+            'ingredients', 'image_renditions',
+        ]
         read_only_fields = ['id']
-
-    def _get_or_create_tags(self, tags, recipe):
-        user = self.context.get('request').user
-        for tag in tags:
-            tag_obj, create = Tag.objects.get_or_create(
-                user=user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
-
-    def _get_or_create_ingredients(self, ings, recipe):
-        user = self.context.get('request').user
-        for ing in ings:
-            ing_obj, create = Ingredient.objects.get_or_create(
-                user=user,
-                **ing,
-            )
-            recipe.ingredients.add(ing_obj)
-
+        list_serializer_class = RecipeListSerializer
+
+    def _set_related(self, field_name, model, items, recipe):
+        """ link the named objects to the recipe, writing only changed rows """
+        objs = model.objects.get_or_create_many(recipe.user, _names(items))
+        through, source, target = Recipe.objects.through_columns(field_name)
+        links = through.objects.filter(**{source: recipe.id})
+        current = set(links.values_list(target, flat=True))
+        stale = current - {obj.id for obj in objs}
+        if stale:
+            links.filter(**{f'{target}__in': stale}).delete()
+        through.objects.bulk_create(
+            [
+                through(**{source: recipe.id, target: obj.id})
+                for obj in objs if obj.id not in current
+            ],
+            ignore_conflicts=True,
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        Recipe.objects.link_names('tags', [recipe], [_names(tags)])
+        Recipe.objects.link_names(
+            'ingredients', [recipe], [_names(ingredients)],
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags', [])
-        ingredients = validated_data.pop('ingredients', [])
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
         recipe = super().update(instance, validated_data)
         if tags is not None:
-            recipe.tags.all().delete()
-            self._get_or_create_tags(tags, recipe)
+            self._set_related('tags', Tag, tags, recipe)
         if ingredients is not None:
-            recipe.ingredients.all().delete()
-            self._get_or_create_ingredients(ingredients, recipe)
+            self._set_related('ingredients', Ingredient, ingredients, recipe)
         return recipe
 
 
@@ -71,8 +155,92 @@ class DetailRecipeSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description']
 
 class RecipeImageSerializer(serializers.ModelSerializer):
+    image_renditions = RenditionsField(read_only=True)
+
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_renditions']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+    def update(self, instance, validated_data):
+        """ store the upload now, render its renditions in the background """
+        instance.image_renditions = {}
+        recipe = super().update(instance, validated_data)
+        schedule_renditions(recipe)
+        return recipe
+
+
+@functools.lru_cache(maxsize=None)
+def _serializer_field(serializer_class, field_name):
+    """ a field of the serializer, built once """
+    return serializer_class().fields[field_name]
+
+
+class RecipeRowSerializer:
+    """
+    Read-only RecipeSerializer for `.values(*columns())` rows.
+
+    The tags and ingredients of all rows are read with one query each and
+    every row becomes a plain dict with the serializer's output, without
+    running the field machinery per row.
+    """
+    serializer_class = RecipeSerializer
+    related_fields = ('tags', 'ingredients')
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def columns(cls):
+        """ the recipe columns to select """
+        return [
+            name for name in cls.serializer_class.Meta.fields
+            if name not in cls.related_fields
+        ]
+
+    def _related(self, field_name, ids):
+        """ {recipe id: [{'id', 'name'}, ...]} ordered by related id """
+        through, source, target = Recipe.objects.through_columns(field_name)
+        links = through.objects.filter(**{f'{source}__in': ids}).order_by(
+            target,
+        ).values_list(source, target, f"{target[:-len('_id')]}__name")
+        related = {recipe_id: [] for recipe_id in ids}
+        for recipe_id, related_id, name in links:
+            related[recipe_id].append({'id': related_id, 'name': name})
+        return related
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        ids = [row['id'] for row in rows]
+        related = {
+            field_name: self._related(field_name, ids) if ids else {}
+            for field_name in self.related_fields
+        }
+        request = self.context.get('request')
+        price = _serializer_field(self.serializer_class, 'price')
+        converters = {
+            'price': price.to_representation,
+            'image_renditions': lambda value: rendition_urls(value, request),
+        }
+        fields = self.serializer_class.Meta.fields
+        results = []
+        for row in rows:
+            item = {}
+            for field_name in fields:
+                if field_name in related:
+                    item[field_name] = related[field_name][row['id']]
+                    continue
+                value = row[field_name]
+                if value is not None and field_name in converters:
+                    value = converters[field_name](value)
+                item[field_name] = value
+            results.append(item)
+        return results if self.many else results[0]
+
+
+class DetailRecipeRowSerializer(RecipeRowSerializer):
+    serializer_class = DetailRecipeSerializer
@@ -0,0 +1,88 @@
+"""
+Signal handlers keeping recipe versions and timestamps current
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core.models import (
+    ChangeBatch,
+    Ingredient,
+    Recipe,
+    RecipeCollectionVersion,
+    Tag,
+    Tombstone,
+)
+
+
+@receiver(post_save, sender=get_user_model())
+def create_collection_version(sender, instance, created, **kwargs):
+    if created:
+        RecipeCollectionVersion.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_on_change(sender, instance, **kwargs):
+    RecipeCollectionVersion.objects.bump(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.record(instance)
+
+
+@receiver(post_delete, sender=get_user_model())
+def delete_tombstones(sender, instance, **kwargs):
+    """ the user's rows are gone, so are the clients to sync them to """
+    Tombstone.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_using(sender, instance, created=False, **kwargs):
+    """ a renamed or deleted tag/ingredient changes the recipes using it """
+    if created:
+        return
+    batch = ChangeBatch.current()
+    if batch is not None and instance.user_id in batch.deleting_users:
+        # the recipes are being deleted along with their user
+        return
+    field_name = 'tags' if sender is Tag else 'ingredients'
+    Recipe.objects.filter(**{field_name: instance}).touch()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def on_links_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # post_clear has no pk_set, so note the recipes losing the link
+        field_name = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        instance._cleared_recipe_ids = list(
+            Recipe.objects.filter(**{field_name: instance}).values_list(
+                'pk', flat=True,
+            )
+        )
+    if not action.startswith('post_'):
+        return
+    RecipeCollectionVersion.objects.bump(instance.user_id)
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif action == 'post_clear':
+        recipe_ids = vars(instance).pop('_cleared_recipe_ids', [])
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).touch()
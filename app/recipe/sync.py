@@ -0,0 +1,80 @@
+"""
+Delta sync of a user's recipes, tags and ingredients
+"""
+from django.db import connection
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+from recipe.serializers import (
+    DetailRecipeSerializer,
+    IngredientSerializer,
+    TagSerializer,
+)
+
+CURSOR_PREFIX = 'x'
+
+
+def current_watermark():
+    """
+    the oldest transaction still running when called: older ones have
+    committed and are visible from now on, any other write comes from a
+    transaction at least this new. a long running transaction holds the
+    watermark back, so clients get recent changes again, but never miss one
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def encode_cursor(txid):
+    return f'{CURSOR_PREFIX}{txid}'
+
+
+def decode_cursor(cursor):
+    """
+    the transaction id encoded in a cursor, ValueError if it is malformed;
+    None for the timestamp cursors of older releases, which need a full sync
+    """
+    if cursor.isascii() and cursor.isdigit():
+        return None
+    digits = cursor[len(CURSOR_PREFIX):]
+    if not (
+        cursor.startswith(CURSOR_PREFIX)
+        and digits.isascii() and digits.isdigit()
+    ):
+        raise ValueError(cursor)
+    txid = int(digits)
+    if not 0 < txid < 2 ** 63:
+        raise ValueError(cursor)
+    return txid
+
+
+def changes_since(user, since=None):
+    """
+    everything the user changed from transaction `since` on (all of it when
+    None) along with the ids deleted since then and the cursor for the next
+    sync, taken before reading so no change can fall between two syncs
+    """
+    cursor = encode_cursor(current_watermark())
+    recipes = Recipe.objects.filter(user=user)
+    tags = Tag.objects.filter(user=user)
+    ingredients = Ingredient.objects.filter(user=user)
+    if since is None:
+        deleted = {kind: [] for kind, _ in Tombstone.KIND_CHOICES}
+    else:
+        recipes = recipes.filter(change_txid__gte=since)
+        tags = tags.filter(change_txid__gte=since)
+        ingredients = ingredients.filter(change_txid__gte=since)
+        deleted = Tombstone.objects.since(user, since)
+    return {
+        'cursor': cursor,
+        'recipes': DetailRecipeSerializer(
+            recipes.for_api().order_by('id'), many=True,
+        ).data,
+        'tags': TagSerializer(
+            tags.for_api().order_by('id'), many=True,
+        ).data,
+        'ingredients': IngredientSerializer(
+            ingredients.for_api().order_by('id'), many=True,
+        ).data,
+        'deleted': deleted,
+    }
@@ -11,6 +11,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+FACETS_URL = reverse('recipe:ingredient-facets')
 
 
 def detail_ingredient_url(id):
@@ -123,4 +124,17 @@ class TestPrivateIngredientApi(TestCase):
         serializer1 = IngredientSerializer(i1)
         res = self.client.get(INGREDIENT_URL, payload)
         self.assertEqual(len(res.data), 1)
-        self.assertIn(serializer1.data, res.data)
\ No newline at end of file
+        self.assertIn(serializer1.data, res.data)
+
+    def test_ingredient_facets(self):
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        Ingredient.objects.create(user=self.user, name='pepper')
+        create_recipe(self.user).ingredients.add(salt)
+        create_recipe(self.user).ingredients.add(salt)
+
+        res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, [{'id': salt.id, 'name': 'salt', 'count': 2}],
+        )
@@ -1,22 +1,40 @@
 from contextlib import AbstractContextManager
 from typing import Any
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
+import csv
+import io
+import json
 import os
 import tempfile
+import threading
+from unittest.mock import patch
 from PIL import Image
 
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from recipe.views import RecipeViewSet
 from recipe.serializers import (
     RecipeSerializer,
     DetailRecipeSerializer,
 )
-from core.models import Recipe, Tag, Ingredient
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeCollectionVersion,
+    Tag,
+    Tombstone,
+)
 
 from decimal import Decimal
 
@@ -40,6 +58,15 @@ def detail_url(pk):
     return reverse('recipe:recipe-detail', kwargs={'pk': pk})
 
 
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+CHANGES_URL = reverse('recipe:recipe-changes')
+
+
 def upload_image_url(id):
     return reverse('recipe:recipe-upload-image', args=[id])
 
@@ -396,6 +423,689 @@ class TestPrivateRecipeApi(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_list_recipes_constant_queries(self):
+        for i in range(5):
+            recipe = create_recipe(self.user, title=f'r{i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f't{i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'i{i}')
+            )
+
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 5)
+
+    def test_retrieve_recipe_constant_queries(self):
+        recipe = create_recipe(self.user)
+        for i in range(5):
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f't{i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'i{i}')
+            )
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 5)
+
+    def test_paginate_recipes_with_cursor(self):
+        recipes = [create_recipe(self.user, title=f'r{i}') for i in range(5)]
+        recipes.reverse()
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r.id for r in recipes[:2]])
+        self.assertIsNone(res.data['previous'])
+
+        seen = list(ids)
+        next_url = res.data['next']
+        while next_url:
+            res = self.client.get(next_url)
+            seen.extend(item['id'] for item in res.data['results'])
+            next_url = res.data['next']
+
+        self.assertEqual(seen, [r.id for r in recipes])
+
+    def test_list_recipes_without_page_params_not_paginated(self):
+        create_recipe(self.user)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertIsInstance(res.data, list)
+
+    def test_schema_documents_both_list_shapes(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        components = schema['components']['schemas']
+
+        for name in ('PaginatedRecipeList', 'PaginatedTagList'):
+            page, plain = components[name]['oneOf']
+            self.assertIn('results', page['properties'])
+            self.assertEqual(plain['type'], 'array')
+
+    def test_filter_by_tags_returns_each_recipe_once(self):
+        recipe = create_recipe(self.user)
+        t1 = Tag.objects.create(user=self.user, name='t1')
+        t2 = Tag.objects.create(user=self.user, name='t2')
+        recipe.tags.add(t1, t2)
+        params = {'tags': f'{t1.id},{t2.id}'}
+        res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_filter_by_tags_match_all(self):
+        r1 = create_recipe(self.user, title='r1')
+        r2 = create_recipe(self.user, title='r2')
+        t1 = Tag.objects.create(user=self.user, name='t1')
+        t2 = Tag.objects.create(user=self.user, name='t2')
+        i1 = Ingredient.objects.create(user=self.user, name='i1')
+        r1.tags.add(t1, t2)
+        r1.ingredients.add(i1)
+        r2.tags.add(t1)
+        r2.ingredients.add(i1)
+        params = {
+            'tags': f'{t1.id},{t2.id}',
+            'ingredients': f'{i1.id}',
+            'match': 'all',
+        }
+        res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [r1.id])
+
+    def test_filter_invalid_match_mode(self):
+        res = self.client.get(RECIPE_URL, {'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_invalid_ids(self):
+        for value in ('x', '1,,2', '-1', str(2 ** 63)):
+            for name in ('tags', 'ingredients'):
+                res = self.client.get(RECIPE_URL, {name: value})
+
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(name, res.data)
+
+    def test_create_recipe_with_many_tags_and_ingredients_bulk(self):
+        Tag.objects.create(user=self.user, name='tag0')
+        payload = {
+            'title': 'recipe1',
+            'price': Decimal('50.6'),
+            'time_minutes': 3,
+            'tags': [{'name': f'tag{i}'} for i in range(20)],
+            'ingredients': [{'name': f'ing{i}'} for i in range(30)],
+        }
+
+        with self.assertNumQueries(14):
+            res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 20)
+        self.assertEqual(recipe.ingredients.count(), 30)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 20)
+
+    def test_create_recipe_with_duplicate_tag_names(self):
+        payload = {
+            'title': 'recipe1',
+            'price': Decimal('50.6'),
+            'time_minutes': 3,
+            'tags': [{'name': 'tag1'}, {'name': 'tag1'}],
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_update_recipe_tags_keeps_shared_tags(self):
+        tag1 = Tag.objects.create(user=self.user, name='tag1')
+        recipe = create_recipe(self.user)
+        other_recipe = create_recipe(self.user)
+        recipe.tags.add(tag1)
+        other_recipe.tags.add(tag1)
+        payload = {'tags': [{'name': 'tag2'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(Tag.objects.filter(id=tag1.id).exists())
+        self.assertIn(tag1, other_recipe.tags.all())
+        self.assertNotIn(tag1, recipe.tags.all())
+
+    def test_update_recipe_only_writes_changed_links(self):
+        tag1 = Tag.objects.create(user=self.user, name='tag1')
+        tag2 = Tag.objects.create(user=self.user, name='tag2')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag1, tag2)
+        link_id = Recipe.tags.through.objects.get(
+            recipe=recipe, tag=tag1,
+        ).id
+        payload = {'tags': [{'name': 'tag1'}, {'name': 'tag3'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(tag['name'] for tag in res.data['tags']),
+            ['tag1', 'tag3'],
+        )
+        self.assertTrue(
+            Recipe.tags.through.objects.filter(id=link_id).exists()
+        )
+
+    def test_partial_update_without_tags_keeps_tags(self):
+        tag = Tag.objects.create(user=self.user, name='tag1')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+        res = self.client.patch(detail_url(recipe.id), {'title': 'new'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(tag, recipe.tags.all())
+
+    def test_bulk_create_recipes(self):
+        Tag.objects.create(user=self.user, name='tag1')
+        payload = [
+            {
+                'title': f'recipe{i}',
+                'price': '5.00',
+                'time_minutes': i,
+                'tags': [{'name': 'tag1'}, {'name': f'tag{i}'}],
+                'ingredients': [{'name': 'ing1'}],
+            }
+            for i in range(1, 4)
+        ]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [r['id'] for r in res.data], [r.id for r in recipes],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(recipes[0].tags.count(), 1)
+        self.assertEqual(recipes[1].tags.count(), 2)
+        self.assertEqual(res.data[2]['ingredients'][0]['name'], 'ing1')
+
+    def test_bulk_create_reports_item_errors(self):
+        payload = [
+            {'title': 'ok', 'price': '5.00', 'time_minutes': 1},
+            {'title': 'bad', 'time_minutes': 1},
+        ]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('price', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_limit(self):
+        payload = [{'title': 'r', 'price': '5.00', 'time_minutes': 1}] * 3
+        with patch.object(RecipeViewSet, 'bulk_max_items', 2):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_empty_list_unsuccessful(self):
+        for method in (self.client.post, self.client.patch):
+            res = method(BULK_URL, [], format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_recipes(self):
+        tag = Tag.objects.create(user=self.user, name='tag1')
+        r1 = create_recipe(self.user, title='r1')
+        r2 = create_recipe(self.user, title='r2')
+        r1.tags.add(tag)
+        payload = [
+            {'id': r2.id, 'title': 'new r2'},
+            {'id': r1.id, 'tags': [{'name': 'tag2'}]},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [r2.id, r1.id])
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.title, 'r1')
+        self.assertEqual(r2.title, 'new r2')
+        self.assertEqual([t.name for t in r1.tags.all()], ['tag2'])
+
+    def test_bulk_update_duplicate_ids_unsuccessful(self):
+        recipe = create_recipe(self.user, title='r1')
+        payload = [
+            {'id': recipe.id, 'title': 'first'},
+            {'id': recipe.id, 'title': 'second'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['id'], [f'{recipe.id} is listed more than once'],
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'r1')
+
+    def test_bulk_update_other_users_recipe_unsuccessful(self):
+        other_user = get_user_model().objects.create_user(
+            email='other@test.com',
+            name='second',
+            password='test12345',
+        )
+        recipe = create_recipe(other_user, title='theirs')
+        payload = [{'id': recipe.id, 'title': 'mine'}]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'theirs')
+
+    def test_bulk_delete_recipes(self):
+        other_user = get_user_model().objects.create_user(
+            email='other@test.com',
+            name='second',
+            password='test12345',
+        )
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        r3 = create_recipe(other_user)
+        res = self.client.delete(BULK_URL, [r1.id, r3.id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], [r1.id])
+        self.assertFalse(Recipe.objects.filter(id=r1.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=r2.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=r3.id).exists())
+
+    def _bulk_delete_queries(self, count):
+        tag = Tag.objects.create(user=self.user, name=f'tag {count}')
+        ids = []
+        for _ in range(count):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(tag)
+            ids.append(recipe.id)
+        version = RecipeCollectionVersion.objects.current(self.user.id)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.delete(BULK_URL, ids, format='json')
+
+        self.assertEqual(res.data['deleted'], sorted(ids, reverse=True))
+        self.assertEqual(
+            set(Tombstone.objects.filter(
+                user=self.user, kind='recipe', object_id__in=ids,
+            ).values_list('object_id', flat=True)),
+            set(ids),
+        )
+        self.assertEqual(
+            RecipeCollectionVersion.objects.current(self.user.id),
+            version + 1,
+        )
+        return len(queries)
+
+    def test_bulk_delete_query_count_independent_of_size(self):
+        self.assertEqual(
+            self._bulk_delete_queries(2), self._bulk_delete_queries(20),
+        )
+
+    def _export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_recipes_ndjson(self):
+        r1 = create_recipe(self.user, title='r1')
+        r2 = create_recipe(self.user, title='r2')
+        r1.tags.add(Tag.objects.create(user=self.user, name='tag1'))
+        create_recipe(get_user_model().objects.create_user(
+            email='other@test.com',
+            password='test12345',
+        ))
+
+        with patch.object(RecipeViewSet, 'export_chunk_size', 1):
+            lines = self._export().splitlines()
+
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [r2.id, r1.id])
+        self.assertEqual(
+            rows[1],
+            json.loads(json.dumps(DetailRecipeSerializer(r1).data)),
+        )
+
+    def test_export_recipes_csv(self):
+        recipe = create_recipe(self.user, title='r1')
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='tag1'),
+            Tag.objects.create(user=self.user, name='tag2'),
+        )
+        rows = list(csv.DictReader(
+            io.StringIO(self._export(export_format='csv'))
+        ))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'r1')
+        self.assertEqual(rows[0]['price'], '50.50')
+        self.assertEqual(sorted(rows[0]['tags'].split('|')), ['tag1', 'tag2'])
+
+    def test_export_invalid_format(self):
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_recipes_served_from_cache(self):
+        create_recipe(self.user)
+        first = self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPE_URL)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_list_recipes_not_modified(self):
+        create_recipe(self.user)
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_list_cache_keyed_on_query(self):
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='t1')
+        recipe.tags.add(tag)
+        create_recipe(self.user)
+        all_recipes = self.client.get(RECIPE_URL)
+        tagged = self.client.get(RECIPE_URL, {'tags': f'{tag.id}'})
+
+        self.assertNotEqual(all_recipes['ETag'], tagged['ETag'])
+        self.assertEqual(len(all_recipes.data), 2)
+        self.assertEqual(len(tagged.data), 1)
+
+    def test_list_cache_invalidated_on_changes(self):
+        recipe = create_recipe(self.user)
+        etag = self.client.get(RECIPE_URL)['ETag']
+        tag = Tag.objects.create(user=self.user, name='t1')
+        recipe.tags.add(tag)
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['tags'][0]['name'], 't1')
+
+        tag.name = 't2'
+        tag.save()
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.data[0]['tags'][0]['name'], 't2')
+
+        recipe.delete()
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.data, [])
+
+    def test_queryset_delete_bumps_version_once(self):
+        for i in range(3):
+            create_recipe(self.user).tags.add(
+                Tag.objects.create(user=self.user, name=f't{i}'),
+            )
+        version = RecipeCollectionVersion.objects.current(self.user.id)
+
+        Tag.objects.filter(user=self.user).delete()
+        Recipe.objects.filter(user=self.user).delete()
+
+        self.assertEqual(
+            RecipeCollectionVersion.objects.current(self.user.id),
+            version + 2,
+        )
+
+    def test_list_cache_invalidated_on_bulk_create(self):
+        self.client.get(RECIPE_URL)
+        payload = [{'title': 'r1', 'price': '5.00', 'time_minutes': 1}]
+        self.client.post(BULK_URL, payload, format='json')
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_recipe_not_modified(self):
+        recipe = create_recipe(self.user)
+        res = self.client.get(detail_url(recipe.id))
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag,
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_retrieve_recipe_if_modified_since(self):
+        recipe = create_recipe(self.user)
+        last_modified = self.client.get(detail_url(recipe.id))['Last-Modified']
+
+        res = self.client.get(
+            detail_url(recipe.id), HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_recipe_modified_by_links(self):
+        recipe = create_recipe(self.user)
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+        tag = Tag.objects.create(user=self.user, name='t1')
+        recipe.tags.add(tag)
+
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+
+        tag.name = 't2'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 't2')
+
+    def test_retrieve_recipe_invalid_id(self):
+        res = self.client.get(detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_recipes_ranks_title_matches_first(self):
+        in_description = create_recipe(
+            self.user, title='stew', description='a hearty tomato stew',
+        )
+        in_title = create_recipe(
+            self.user, title='Tomato soup', description='warming',
+        )
+        create_recipe(self.user, title='pancakes', description='sweet')
+        create_recipe(
+            get_user_model().objects.create_user('o@example.com', 'pw'),
+            title='tomato salad',
+        )
+
+        res = self.client.get(RECIPE_URL, {'search': 'tomatoes'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['id'] for r in res.data], [in_title.id, in_description.id],
+        )
+
+    def test_search_recipes_after_update(self):
+        recipe = create_recipe(self.user, title='pancakes')
+        recipe.title = 'waffles'
+        recipe.save()
+
+        res = self.client.get(RECIPE_URL, {'search': 'waffle'})
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+        res = self.client.get(RECIPE_URL, {'search': 'pancakes'})
+        self.assertEqual(res.data, [])
+
+    def test_search_recipes_ignores_pagination(self):
+        for i in range(3):
+            create_recipe(self.user, title=f'soup {i}')
+
+        with patch.object(RecipeViewSet, 'search_max_results', 2):
+            res = self.client.get(
+                RECIPE_URL, {'search': 'soup', 'page_size': 1},
+            )
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_search_fallback_without_postgres(self):
+        recipe = create_recipe(self.user, title='Tomato soup')
+        create_recipe(self.user, title='pancakes')
+
+        with patch.object(connection, 'vendor', 'sqlite'):
+            found = list(Recipe.objects.search('tomato'))
+
+        self.assertEqual(found, [recipe])
+
+    def test_tombstones_removed_with_user(self):
+        create_recipe(self.user).delete()
+        self.assertTrue(Tombstone.objects.filter(user=self.user).exists())
+        user_id = self.user.id
+
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.filter(user_id=user_id).exists())
+
+    def _user_delete_queries(self, count):
+        user = get_user_model().objects.create_user(
+            email=f'delete{count}@test.com', password='test12345',
+        )
+        for i in range(count):
+            recipe = create_recipe(user)
+            recipe.tags.add(Tag.objects.create(user=user, name=f'tag {i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=user, name=f'ingredient {i}')
+            )
+        user_id = user.id
+        with CaptureQueriesContext(connection) as queries:
+            user.delete()
+
+        self.assertFalse(Tombstone.objects.filter(user_id=user_id).exists())
+        return len(queries)
+
+    def test_user_delete_query_count_independent_of_rows(self):
+        self.assertEqual(
+            self._user_delete_queries(2), self._user_delete_queries(20),
+        )
+
+
+class TestRecipeSync(TransactionTestCase):
+    """ cursors follow commits, so each change needs its own transaction """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test1@test.com',
+            name='test',
+            password='test12345',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_changes_full_sync(self):
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='t1')
+        recipe.tags.add(tag)
+        create_recipe(get_user_model().objects.create_user(
+            'other@example.com', 'testpass123',
+        ))
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['recipes']], [recipe.id])
+        self.assertEqual(res.data['tags'], [{'id': tag.id, 'name': 't1'}])
+        self.assertEqual(res.data['ingredients'], [])
+        self.assertEqual(
+            res.data['deleted'],
+            {'recipe': [], 'tag': [], 'ingredient': []},
+        )
+        self.assertTrue(res.data['cursor'])
+
+    def test_changes_since_cursor(self):
+        kept = create_recipe(self.user, title='kept')
+        changed = create_recipe(self.user, title='changed')
+        removed = create_recipe(self.user, title='removed')
+        tag = Tag.objects.create(user=self.user, name='t1')
+        ingredient = Ingredient.objects.create(user=self.user, name='i1')
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        changed.title = 'changed again'
+        changed.save()
+        removed_id, tag_id = removed.id, tag.id
+        removed.delete()
+        tag.delete()
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['title'] for r in res.data['recipes']], ['changed again'],
+        )
+        self.assertEqual(res.data['tags'], [])
+        self.assertEqual(res.data['ingredients'], [])
+        self.assertEqual(res.data['deleted'], {
+            'recipe': [removed_id], 'tag': [tag_id], 'ingredient': [],
+        })
+        self.assertNotIn(kept.id, [r['id'] for r in res.data['recipes']])
+        self.assertTrue(Ingredient.objects.filter(id=ingredient.id).exists())
+
+    def test_changes_include_recipes_with_renamed_tags(self):
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='t1')
+        recipe.tags.add(tag)
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        tag.name = 't2'
+        tag.save()
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.data['tags'], [{'id': tag.id, 'name': 't2'}])
+        self.assertEqual(res.data['recipes'][0]['tags'][0]['name'], 't2')
+
+    def test_changes_include_late_commits(self):
+        """ a change committed after a sync is sent by the next one """
+        saved, synced = threading.Event(), threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    create_recipe(self.user, title='late')
+                    saved.set()
+                    synced.wait(5)
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        saved.wait(5)
+        first = self.client.get(CHANGES_URL).data
+        synced.set()
+        writer.join()
+        res = self.client.get(CHANGES_URL, {'since': first['cursor']})
+
+        self.assertEqual(first['recipes'], [])
+        self.assertEqual(
+            [r['title'] for r in res.data['recipes']], ['late'],
+        )
+
+    def test_changes_legacy_cursor_gets_full_sync(self):
+        recipe = create_recipe(self.user)
+
+        res = self.client.get(CHANGES_URL, {'since': '1700000000000000'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['recipes']], [recipe.id])
+
+    def test_changes_invalid_cursor(self):
+        for cursor in ('abc', '-1', 'x', 'x-1', 'x0', 'x+1', 'x' + '9' * 30):
+            res = self.client.get(CHANGES_URL, {'since': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TestUploadImage(TestCase):
     def setUp(self):
@@ -434,3 +1144,229 @@ class TestUploadImage(TestCase):
         res = self.client.post(url ,payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(RECIPE_IMAGES={
+    'BACKEND': 'recipe.images.SyncBackend',
+    'SIZES': {'small': 32, 'medium': 64},
+})
+class TestImageRenditions(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@example.com', '12345pass',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def _upload(self, size=(200, 100)):
+        image = Image.new('RGB', size, 'red')
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera maker'
+        upload = io.BytesIO()
+        image.save(upload, format='JPEG', exif=exif.tobytes())
+        upload.name = 'photo.jpg'
+        upload.seek(0)
+        return self.client.post(
+            upload_image_url(self.recipe.id), {'image': upload},
+            format='multipart',
+        )
+
+    def _post_file(self, content, name='photo.jpg'):
+        upload = io.BytesIO(content)
+        upload.name = name
+        return self.client.post(
+            upload_image_url(self.recipe.id), {'image': upload},
+            format='multipart',
+        )
+
+    def _png(self, size):
+        content = io.BytesIO()
+        Image.new('L', size).save(content, format='PNG')
+        return content.getvalue()
+
+    def test_upload_rejects_non_image(self):
+        res = self._post_file(b'#!/bin/sh\necho not an image\n' * 10)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_rejects_truncated_image(self):
+        res = self._post_file(self._png((50, 50))[:20], name='photo.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_rejects_oversized_file(self):
+        content = self._png((50, 50)) + b'\0' * 4096
+        with self.settings(RECIPE_IMAGES={'MAX_UPLOAD_SIZE': 1024}):
+            res = self._post_file(content, name='photo.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bytes', str(res.data['image'][0]))
+
+    def test_upload_rejects_too_many_pixels(self):
+        with self.settings(RECIPE_IMAGES={'MAX_PIXELS': 1000 * 1000}):
+            res = self._post_file(self._png((2000, 1000)), name='photo.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', str(res.data['image'][0]))
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_renders_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_renditions'], {})
+        self.assertEqual(len(callbacks), 1)
+
+    def test_upload_renders_resized_copies_without_metadata(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload()
+
+        self.recipe.refresh_from_db()
+        renditions = self.recipe.image_renditions
+        self.assertEqual(set(renditions), {'small', 'medium'})
+        expected = {'small': (32, 16), 'medium': (64, 32)}
+        for label, names in renditions.items():
+            self.assertEqual(set(names), {'webp', 'jpeg'})
+            for extension, name in names.items():
+                self.assertTrue(name.endswith(f'.{extension}'))
+                with Image.open(os.path.join(self.media.name, name)) as img:
+                    self.assertEqual(img.size, expected[label])
+                    self.assertEqual(len(img.getexif()), 0)
+
+    def test_recipe_detail_exposes_rendition_urls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        url = res.data['image_renditions']['small']['webp']
+        self.assertTrue(url.startswith('http://testserver/static/media/'))
+        self.assertTrue(url.endswith('.webp'))
+
+    def test_render_images_command_renders_lost_jobs(self):
+        # the on_commit job never runs, as if the process had restarted
+        with self.captureOnCommitCallbacks():
+            self._upload()
+        out = io.StringIO()
+
+        call_command('render_images', dry_run=True, stdout=out)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_renditions, {})
+        self.assertIn('Would render 1 images', out.getvalue())
+
+        call_command('render_images', stdout=out)
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            set(self.recipe.image_renditions), {'small', 'medium'},
+        )
+        self.assertIn('Rendered 1 images, skipped 0', out.getvalue())
+
+    def test_stale_image_not_recorded(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload()
+        self.recipe.refresh_from_db()
+        current = self.recipe.image_renditions
+
+        callbacks[0]()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_renditions, current)
+
+
+class TestRecipeRowSerializer(TestCase):
+    """ list and retrieve render rows exactly like the serializers """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='rows@example.com', password='test12345',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('vegan', 'dessert', 'quick')
+        ]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('salt', 'flour')
+        ]
+        recipe = create_recipe(
+            self.user, title='Crème brûlée', price=Decimal('5.5'), link='',
+            image_renditions={
+                'small': {'webp': 'uploads/recipe/renditions/a-small.webp'},
+            },
+        )
+        recipe.tags.add(tags[2], tags[0])
+        recipe.ingredients.add(*ingredients)
+        create_recipe(self.user, title='plain', price=Decimal('12'))
+        self.recipe = recipe
+        self.request = APIRequestFactory().get('/')
+
+    def _render(self, serializer_class, instance, **kwargs):
+        return JSONRenderer().render(serializer_class(
+            instance, context={'request': self.request}, **kwargs,
+        ).data)
+
+    def test_list_matches_serializer(self):
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.content,
+            self._render(RecipeSerializer, recipes.for_api(), many=True),
+        )
+
+    def test_paginated_list_matches_serializer(self):
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        first = self.client.get(RECIPE_URL, {'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertEqual(
+            first['results'] + second['results'],
+            json.loads(self._render(
+                RecipeSerializer, recipes.for_api(), many=True,
+            )),
+        )
+
+    def test_retrieve_matches_serializer(self):
+        recipe = Recipe.objects.for_api().get(pk=self.recipe.pk)
+
+        res = self.client.get(detail_url(self.recipe.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.content, self._render(DetailRecipeSerializer, recipe),
+        )
+
+    def test_list_reads_rows_in_bulk(self):
+        for i in range(5):
+            recipe = create_recipe(self.user, title=f'more {i}')
+            recipe.tags.add(*Tag.objects.filter(user=self.user))
+
+        # version, recipes, tags, ingredients
+        with self.assertNumQueries(4), patch.object(
+            RecipeSerializer, 'to_representation',
+        ) as to_representation:
+            res = self.client.get(RECIPE_URL)
+
+        to_representation.assert_not_called()
+        self.assertEqual(len(res.data), 7)
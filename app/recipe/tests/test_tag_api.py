@@ -2,14 +2,22 @@ from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
 from decimal import Decimal
+import os
+from unittest.mock import patch
 
+from django.db import connection
+
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag, Recipe
+from core.models import Tag, Ingredient, Recipe, has_trigram
 from recipe.serializers import TagSerializer
+from recipe.views import TagViewSet
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+FACETS_URL = reverse('recipe:tag-facets')
 
 
 def detail_tag(id):
@@ -52,6 +60,7 @@ class TestPrivateTagApi(TestCase):
         self.user = create_user()
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        TagViewSet.autocomplete_cache.clear()
 
     def test_list_tags_for_authenticated_user(self):
         Tag.objects.create(user=self.user, name='tag1')
@@ -89,6 +98,17 @@ class TestPrivateTagApi(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_to_existing_name_unsuccessful(self):
+        Tag.objects.create(user=self.user, name='tag1')
+        tag = Tag.objects.create(user=self.user, name='tag2')
+        Tag.objects.create(user=create_user('other@example.com'), name='tag3')
+
+        res = self.client.patch(detail_tag(tag.id), {'name': 'tag1'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.patch(detail_tag(tag.id), {'name': 'tag3'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
     def test_update_tag_user_unsuccessful(self):
         tag = Tag.objects.create(user=self.user, name='tag1')
         other_user = create_user(email='newuser@example.com')
@@ -138,4 +158,190 @@ class TestPrivateTagApi(TestCase):
         res = self.client.get(TAGS_URL, payload)
 
         self.assertEqual(len(res.data), 1)
-        self.assertIn(serializer1.data, res.data)
\ No newline at end of file
+        self.assertIn(serializer1.data, res.data)
+
+    def test_paginate_tags_with_cursor(self):
+        Tag.objects.create(user=self.user, name='a')
+        Tag.objects.create(user=self.user, name='b')
+        Tag.objects.create(user=self.user, name='c')
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [item['name'] for item in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names.extend(item['name'] for item in res.data['results'])
+
+        self.assertEqual(names, ['c', 'b', 'a'])
+        self.assertIsNone(res.data['next'])
+
+    def test_autocomplete_tags_by_prefix(self):
+        for name in ('Tomato', 'tomatillo', 'potato', 'Tofu'):
+            Tag.objects.create(user=self.user, name=name)
+        Tag.objects.create(user=create_user('o@example.com'), name='tomb')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tom'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(
+            [item['name'] for item in res.data][:2], ['tomatillo', 'Tomato'],
+        )
+        self.assertNotIn('tomb', [item['name'] for item in res.data])
+
+    def test_autocomplete_tags_limit(self):
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'tag{i}')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 2})
+
+        self.assertEqual(
+            [item['name'] for item in res.data], ['tag0', 'tag1'],
+        )
+
+    def test_autocomplete_tags_invalid_params(self):
+        for params in ({}, {'q': ' '}, {'q': 'a', 'limit': 'x'},
+                       {'q': 'a', 'limit': 0}):
+            res = self.client.get(AUTOCOMPLETE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags_cached_until_change(self):
+        Tag.objects.create(user=self.user, name='tomato')
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'tom'})
+
+        with self.assertNumQueries(1):
+            res = self.client.get(AUTOCOMPLETE_URL, {'q': 'TOM'})
+        self.assertEqual(len(res.data), 1)
+
+        Tag.objects.create(user=self.user, name='tomatillo')
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tom'})
+        self.assertEqual(len(res.data), 2)
+
+    def test_autocomplete_tags_fuzzy(self):
+        # checked here, once the test database exists
+        if not has_trigram(connection):
+            if os.environ.get('REQUIRE_PG_TRGM'):
+                self.fail('pg_trgm is not installed in the test database')
+            self.skipTest('needs pg_trgm')
+        Tag.objects.create(user=self.user, name='tomato')
+        Tag.objects.create(user=self.user, name='pasta')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tomatoe'})
+
+        self.assertEqual([item['name'] for item in res.data], ['tomato'])
+
+    def test_autocomplete_tags_fuzzy_query(self):
+        # runs without pg_trgm too; the query is only compiled
+        with patch('core.models.has_trigram', return_value=True):
+            queryset = Tag.objects.autocomplete(self.user, 'tomatoe', 5)
+        sql = str(queryset.query)
+
+        self.assertIn('UPPER("core_tag"."name")::text LIKE TOMATOE%', sql)
+        self.assertIn('UPPER("core_tag"."name") % TOMATOE', sql)
+        self.assertIn('SIMILARITY(UPPER("core_tag"."name"), TOMATOE)', sql)
+        self.assertIn('LIMIT 5', sql)
+        self.assertEqual(queryset.query.order_by, (
+            '-is_prefix', '-similarity', 'upper_name', 'id',
+        ))
+
+    def test_autocomplete_schema_is_a_list(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        operation = schema['paths']['/api/recipe/tags/autocomplete/']['get']
+
+        response = operation['responses']['200']['content']
+        self.assertEqual(response['application/json']['schema'], {
+            'type': 'array', 'items': {'$ref': '#/components/schemas/Tag'},
+        })
+        self.assertEqual(
+            {param['name'] for param in operation['parameters']},
+            {'q', 'limit'},
+        )
+
+    def test_tag_facets(self):
+        vegan = Tag.objects.create(user=self.user, name='vegan')
+        quick = Tag.objects.create(user=self.user, name='quick')
+        Tag.objects.create(user=self.user, name='unused')
+        for i in range(3):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(vegan)
+            if i == 0:
+                recipe.tags.add(quick)
+        other = create_user('o@example.com')
+        create_recipe(other).tags.add(Tag.objects.create(user=other, name='x'))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': vegan.id, 'name': 'vegan', 'count': 3},
+            {'id': quick.id, 'name': 'quick', 'count': 1},
+        ])
+
+    def test_tag_facets_invalid_ids(self):
+        res = self.client.get(FACETS_URL, {'tags': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_tag_facets_respect_recipe_filters(self):
+        vegan = Tag.objects.create(user=self.user, name='vegan')
+        tofu = Ingredient.objects.create(user=self.user, name='tofu')
+        r1 = create_recipe(self.user, title='tofu soup')
+        r1.tags.add(vegan)
+        r1.ingredients.add(tofu)
+        create_recipe(self.user, title='salad').tags.add(vegan)
+
+        res = self.client.get(FACETS_URL, {'ingredients': str(tofu.id)})
+        self.assertEqual(res.data[0]['count'], 1)
+
+        res = self.client.get(FACETS_URL, {'search': 'salad'})
+        self.assertEqual(res.data[0]['count'], 1)
+
+    def test_tag_facets_cached_until_change(self):
+        vegan = Tag.objects.create(user=self.user, name='vegan')
+        create_recipe(self.user).tags.add(vegan)
+        etag = self.client.get(FACETS_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(FACETS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_recipe(self.user).tags.add(vegan)
+        res = self.client.get(FACETS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['count'], 2)
+
+    def test_filter_tags_by_unassigned(self):
+        t1 = Tag.objects.create(user=self.user, name='tag1')
+        t2 = Tag.objects.create(user=self.user, name='tag2')
+        create_recipe(self.user).tags.add(t1)
+
+        res = self.client.get(TAGS_URL, {'unassigned_only': 1})
+
+        self.assertEqual(res.data, [TagSerializer(t2).data])
+
+    def test_filter_tags_assigned_and_unassigned_unsuccessful(self):
+        res = self.client.get(
+            TAGS_URL, {'assigned_only': 1, 'unassigned_only': 1},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_tags_with_usage_count(self):
+        t1 = Tag.objects.create(user=self.user, name='tag1')
+        Tag.objects.create(user=self.user, name='tag2')
+        create_recipe(self.user).tags.add(t1)
+        create_recipe(self.user).tags.add(t1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                TAGS_URL, {'usage_count': 1, 'assigned_only': 1},
+            )
+
+        self.assertEqual(
+            res.data, [{'id': t1.id, 'name': 'tag1', 'usage_count': 2}],
+        )
+
+        res = self.client.get(TAGS_URL, {'usage_count': 1})
+        self.assertEqual(
+            [item['usage_count'] for item in res.data], [0, 2],
+        )
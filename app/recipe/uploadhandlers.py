@@ -0,0 +1,99 @@
+"""
+Upload handler validating recipe images while they stream in
+"""
+import warnings
+
+from django.core.files.uploadhandler import (
+    SkipFile,
+    TemporaryFileUploadHandler,
+)
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+
+from recipe.images import image_options
+
+# leading bytes of the accepted image formats, as (offset, bytes) parts
+SIGNATURES = (
+    ((0, b'\xff\xd8\xff'),),
+    ((0, b'\x89PNG\r\n\x1a\n'),),
+    ((0, b'GIF87a'),),
+    ((0, b'GIF89a'),),
+    ((0, b'RIFF'), (8, b'WEBP')),
+)
+SNIFF_SIZE = 12
+
+
+def is_image_header(header):
+    return any(
+        all(
+            header[offset:offset + len(part)] == part
+            for offset, part in signature
+        )
+        for signature in SIGNATURES
+    )
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spool uploaded images to disk, skipping files that are too large, do
+    not start like an image or declare too many pixels. The reasons end
+    up in `errors` by field name.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        options = image_options()
+        self.max_size = options['MAX_UPLOAD_SIZE']
+        self.max_pixels = options['MAX_PIXELS']
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+
+    def _reject(self, message):
+        self.errors[self.field_name] = [message]
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self._reject(_('Image larger than %d bytes.') % self.max_size)
+        if len(self.header) < SNIFF_SIZE:
+            self.header += raw_data[:SNIFF_SIZE - len(self.header)]
+            if len(self.header) == SNIFF_SIZE and not is_image_header(
+                self.header,
+            ):
+                self._reject(_('Upload a valid image.'))
+        return super().receive_data_chunk(raw_data, start)
+
+    def _pixels(self, upload):
+        """ pixel count from the image header, None if it is not an image """
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                with Image.open(upload) as image:
+                    width, height = image.size
+        except Image.DecompressionBombError:
+            # past Pillow's own limit, which may be above ours
+            return float('inf')
+        except (OSError, SyntaxError):
+            return None
+        return width * height
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        # opening reads only the header, nothing is decoded yet
+        pixels = None
+        if is_image_header(self.header):
+            pixels = self._pixels(upload)
+        if pixels is None:
+            message = _('Upload a valid image.')
+        elif pixels > self.max_pixels:
+            message = _('Image larger than %d pixels.') % self.max_pixels
+        else:
+            upload.seek(0)
+            return upload
+        # returning nothing leaves the file out of request.FILES
+        upload.close()
+        self.errors[self.field_name] = [message]
+        return None
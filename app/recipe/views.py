@@ -1,3 +1,6 @@
+from collections import Counter
+from functools import partial
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -7,56 +10,162 @@ from drf_spectacular.utils import (
 from recipe.serializers import (
     RecipeSerializer,
     DetailRecipeSerializer,
+    RecipeRowSerializer,
+    DetailRecipeRowSerializer,
     TagSerializer,
+    TagUsageSerializer,
     IngredientSerializer,
+    IngredientUsageSerializer,
     RecipeImageSerializer,
 )
-from core.models import Recipe, Tag, Ingredient
+from recipe.cache import ResponseCache
+from recipe.export import EXPORTERS
+from recipe.sync import changes_since, decode_cursor
+from recipe.uploadhandlers import ImageUploadHandler
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeRelatedCursorPagination,
+)
+from core.cache import LRUCache
+from core.models import Recipe, Tag, Ingredient, RecipeCollectionVersion
+from user.authentication import CachedTokenAuthentication
 
 from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
 
 
-@extend_schema_view(
-    list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma separated list of IDS to filter'
-            ),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Comma separated list of IDS to filter'
+AUTOCOMPLETE_PARAMETERS = [
+    OpenApiParameter(
+        'q', OpenApiTypes.STR, required=True,
+        description='Start (or, fuzzily, part) of the name',
+    ),
+    OpenApiParameter(
+        'limit', OpenApiTypes.INT,
+        description='Number of matches to return (max 50)',
+    ),
+]
+
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of IDS to filter'
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of IDS to filter'
+    ),
+    OpenApiParameter(
+        'match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description='Match any (default) or all of the given IDS',
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Full text search of titles and descriptions, '
+                    'returns the best matches first',
+    ),
+]
+
+
+class RecipeFilterMixin:
+    """ filter recipes by the tags, ingredients and search parameters """
+
+    def _params_to_ints(self, name):
+        """ the ids in a comma separated query parameter """
+        try:
+            ids = [
+                int(ch) for ch in self.request.query_params[name].split(',')
+            ]
+        except ValueError:
+            ids = None
+        if not ids or not all(0 < pk < 2 ** 63 for pk in ids):
+            raise ValidationError(
+                {name: _('must be a comma separated list of ids')}
             )
-        ]
-    )
+        return ids
+
+    def _match_all(self):
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': _('must be "any" or "all"')})
+        return match == 'all'
+
+    def filter_recipes(self, queryset):
+        tags = self.request.query_params.get('tags')
+        ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match_all = self._match_all()
+        if tags:
+            tags_ids = self._params_to_ints('tags')
+            queryset = queryset.with_tags(tags_ids, match_all)
+        if ingredients:
+            ingredients_ids = self._params_to_ints('ingredients')
+            queryset = queryset.with_ingredients(ingredients_ids, match_all)
+        if search:
+            queryset = queryset.search(search)
+        return queryset
+
+
+@extend_schema_view(
+    list=extend_schema(parameters=RECIPE_FILTER_PARAMETERS)
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeFilterMixin, viewsets.ModelViewSet):
     serializer_class = DetailRecipeSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    bulk_max_items = 1000
+    export_chunk_size = 500
+    search_max_results = 100
+    list_cache = ResponseCache('recipe-list')
+    # reads rendered from .values() rows instead of model instances
+    row_serializer_classes = {
+        'list': RecipeRowSerializer,
+        'retrieve': DetailRecipeRowSerializer,
+    }
 
-    def _params_to_ints(self, st):
-        return [int(ch) for ch in st.split(',')]
-
+    def get_row_serializer_class(self):
+        """ the row serializer for this request, None to use the models """
+        if getattr(self, 'swagger_fake_view', False):
+            return None
+        if self.request.method not in ('GET', 'HEAD'):
+            return None
+        return self.row_serializer_classes.get(self.action)
 
     def get_queryset(self):
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tags_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tags_ids)
-        if ingredients:
-            ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
-        return queryset.filter(user=self.request.user).order_by('-id').distinct()
+        queryset = self.filter_recipes(
+            self.queryset.filter(user=self.request.user),
+        )
+        if not self.request.query_params.get('search'):
+            queryset = queryset.order_by('-id')
+        row_serializer_class = self.get_row_serializer_class()
+        if row_serializer_class is not None:
+            return queryset.values(*row_serializer_class.columns())
+        return queryset.for_api()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('search'):
+            return queryset[:self.search_max_results]
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        row_serializer_class = self.get_row_serializer_class()
+        if row_serializer_class is not None:
+            kwargs.setdefault('context', self.get_serializer_context())
+            return row_serializer_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -68,16 +177,178 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """ retrieve a recipe, answering 304 if the client copy is current """
+        try:
+            updated_at = Recipe.objects.filter(
+                user=request.user, pk=kwargs['pk'],
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = quote_etag(
+            f"{kwargs['pk']}-{updated_at.timestamp()}-"
+            f"{request.accepted_media_type}"
+        )
+        last_modified = int(updated_at.timestamp())
+        conditional = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        if conditional is None:
+            conditional = super().retrieve(request, *args, **kwargs)
+        conditional['ETag'] = etag
+        conditional['Last-Modified'] = http_date(last_modified)
+        conditional['Cache-Control'] = 'private, no-cache'
+        return conditional
+
+    def list(self, request, *args, **kwargs):
+        """ list recipes, cached until the user's collection changes """
+        return self.list_cache.cached_response(
+            request, partial(super().list, request, *args, **kwargs),
+        )
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
+        # must be installed before the body is parsed
+        handler = ImageUploadHandler(request)
+        request.upload_handlers = [handler]
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
+        if handler.errors:
+            return Response(handler.errors, status=status.HTTP_400_BAD_REQUEST)
 
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError(_('expected a list of items'))
+        if not items:
+            raise ValidationError(_('expected at least one item'))
+        if len(items) > self.bulk_max_items:
+            raise ValidationError(
+                _('at most %d items per request') % self.bulk_max_items
+            )
+        return items
+
+    def _bulk_ids(self, items):
+        try:
+            return [int(item['id'] if isinstance(item, dict) else item)
+                    for item in items]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError({'id': _('every item needs a valid id')})
+
+    def _bulk_create(self, request, items):
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _bulk_update(self, request, items):
+        ids = self._bulk_ids(items)
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1
+        )
+        if duplicates:
+            raise ValidationError(
+                {'id': [f'{pk} is listed more than once' for pk in duplicates]}
+            )
+        recipes = self.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in recipes]
+        if missing:
+            raise ValidationError(
+                {'id': [f'{pk} not found' for pk in missing]}
+            )
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids], data=items, many=True, partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def _bulk_delete(self, request, items):
+        ids = self._bulk_ids(items)
+        recipes = self.get_queryset().filter(id__in=ids)
+        deleted = list(recipes.values_list('id', flat=True))
+        Recipe.objects.filter(id__in=deleted).delete()
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        methods=['POST', 'PATCH'],
+        request=DetailRecipeSerializer(many=True),
+        responses=DetailRecipeSerializer(many=True),
+    )
+    @extend_schema(
+        methods=['DELETE'],
+        request={'application/json': {
+            'type': 'array', 'items': {'type': 'integer'},
+        }},
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """ create, update (by id) or delete (by id) many recipes at once """
+        items = self._bulk_items(request)
+        if request.method == 'PATCH':
+            return self._bulk_update(request, items)
+        elif request.method == 'DELETE':
+            return self._bulk_delete(request, items)
+        return self._bulk_create(request, items)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'export_format',
+                OpenApiTypes.STR, enum=['ndjson', 'csv'],
+                description='Export as NDJSON (default) or CSV',
+            ),
+        ],
+        responses={200: OpenApiTypes.STR},
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """ stream all matching recipes as NDJSON or CSV """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORTERS:
+            raise ValidationError(
+                {'export_format': _('must be "ndjson" or "csv"')}
+            )
+        exporter, content_type = EXPORTERS[export_format]
+        recipes = self.get_queryset().chunked(self.export_chunk_size)
+        response = StreamingHttpResponse(
+            exporter(recipes), content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{export_format}"'
+        )
+        return response
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.STR,
+                description='Cursor returned by the previous sync, '
+                            'omit for a full sync',
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(methods=['GET'], detail=False, url_path='changes')
+    def changes(self, request):
+        """ recipes, tags and ingredients changed or deleted since a cursor """
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = decode_cursor(since)
+            except ValueError:
+                raise ValidationError({'since': _('invalid cursor')})
+        return Response(changes_since(request.user, since or None))
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -85,35 +356,150 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0,1],
                 description='Filter by items assigned to recipes',
-            )
+            ),
+            OpenApiParameter(
+                'unassigned_only',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Filter by items not assigned to any recipe',
+            ),
+            OpenApiParameter(
+                'usage_count',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include the number of recipes using each item',
+            ),
         ]
     )
 )
-class BaseRecipeRelatedView(mixins.UpdateModelMixin,
-                 mixins.ListModelMixin,
-                 mixins.DestroyModelMixin,
-                 viewsets.GenericViewSet):
+class BaseRecipeRelatedView(RecipeFilterMixin,
+                            mixins.UpdateModelMixin,
+                            mixins.ListModelMixin,
+                            mixins.DestroyModelMixin,
+                            viewsets.GenericViewSet):
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeRelatedCursorPagination
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
+    # keyed on the collection version, so entries go stale on any change
+    autocomplete_cache = LRUCache(1024)
+
+    def _flag(self, name):
+        value = self.request.query_params.get(name, '0')
+        if value not in ('0', '1'):
+            raise ValidationError({name: _('must be 0 or 1')})
+        return value == '1'
 
     def get_queryset(self):
-        is_assigned = bool(int(
-            self.request.query_params.get('assigned_only', 0)
-        ))
+        is_assigned = self._flag('assigned_only')
+        is_unassigned = self._flag('unassigned_only')
+        if is_assigned and is_unassigned:
+            raise ValidationError(
+                _('assigned_only and unassigned_only are exclusive')
+            )
         queryset = self.queryset
-        if is_assigned:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+        if is_assigned or is_unassigned:
+            queryset = queryset.assigned(is_assigned)
+        if self.action == 'list' and self._flag('usage_count'):
+            queryset = queryset.with_usage_count()
+        return queryset.filter(
+            user=self.request.user,
+        ).for_api().order_by('-name')
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self._flag('usage_count'):
+            return self.usage_serializer_class
+        return self.serializer_class
+
+    @extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(methods=['GET'], detail=False, url_path='facets')
+    def facets(self, request):
+        """ how many of the filtered recipes use each tag or ingredient """
+        recipes = self.filter_recipes(
+            Recipe.objects.filter(user=request.user),
+        )
+        cache = ResponseCache(f'{self.queryset.model._meta.model_name}-facets')
+        return cache.cached_response(
+            request, lambda: Response(list(self.queryset.facets(recipes))),
+        )
+
+    def _autocomplete_limit(self):
+        try:
+            limit = int(self.request.query_params.get(
+                'limit', self.autocomplete_limit,
+            ))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({'limit': _('must be a positive integer')})
+        return min(limit, self.autocomplete_max_limit)
+
+    def autocomplete_response(self, request):
+        """ the best matching names for a typeahead """
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise ValidationError({'q': _('this parameter is required')})
+        limit = self._autocomplete_limit()
+        version = RecipeCollectionVersion.objects.current(request.user.id)
+        key = (
+            self.queryset.model._meta.label, request.user.id, version,
+            term.lower(), limit,
+        )
+        data = None
+        if version is not None:
+            data = self.autocomplete_cache.get(key)
+        if data is None:
+            matches = self.queryset.autocomplete(request.user, term, limit)
+            data = self.get_serializer(matches, many=True).data
+            if version is not None:
+                self.autocomplete_cache.set(key, data)
+        return Response(data)
+
+    def perform_update(self, serializer):
+        name = serializer.validated_data.get('name')
+        taken = name is not None and self.queryset.filter(
+            user=self.request.user, name=name,
+        ).exclude(pk=serializer.instance.pk).exists()
+        if taken:
+            raise ValidationError({'name': _('already exists')})
+        serializer.save()
 
 class TagViewSet(BaseRecipeRelatedView):
     serializer_class = TagSerializer
+    usage_serializer_class = TagUsageSerializer
     queryset = Tag.objects.all()
 
+    # declared per viewset, the schema of an inherited action is shared
+    @extend_schema(
+        parameters=AUTOCOMPLETE_PARAMETERS,
+        responses=TagSerializer(many=True),
+    )
+    @action(
+        methods=['GET'], detail=False, url_path='autocomplete',
+        pagination_class=None,
+    )
+    def autocomplete(self, request):
+        """ the best matching tag names for a typeahead """
+        return self.autocomplete_response(request)
+
 
 class IngredientViewSet(BaseRecipeRelatedView):
 
     serializer_class = IngredientSerializer
+    usage_serializer_class = IngredientUsageSerializer
     queryset = Ingredient.objects.all()
 
-    
\ No newline at end of file
+    @extend_schema(
+        parameters=AUTOCOMPLETE_PARAMETERS,
+        responses=IngredientSerializer(many=True),
+    )
+    @action(
+        methods=['GET'], detail=False, url_path='autocomplete',
+        pagination_class=None,
+    )
+    def autocomplete(self, request):
+        """ the best matching ingredient names for a typeahead """
+        return self.autocomplete_response(request)
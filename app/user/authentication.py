@@ -0,0 +1,82 @@
+"""
+Token authentication with cached token lookups
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import LRUCache
+
+DEFAULTS = {
+    'MAX_SIZE': 1024,
+    'TTL': 30,
+    'CACHE_ALIAS': None,
+}
+
+
+class TokenCache:
+    """
+    Two level token cache: a per process LRU with TTL in front of an
+    optional shared Django cache backend.
+    """
+
+    def __init__(self, max_size, ttl, cache_alias=None):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._local = LRUCache(max_size, ttl)
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+        return cls(
+            options['MAX_SIZE'], options['TTL'], options['CACHE_ALIAS'],
+        )
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def _shared_key(self, key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        token = self._local.get(key)
+        if token is None and self.shared is not None:
+            token = self.shared.get(self._shared_key(key))
+            if token is not None:
+                self._local.set(key, token)
+        return token
+
+    def set(self, key, token):
+        self._local.set(key, token)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), token, self.ttl)
+
+    def delete(self, key):
+        self._local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        self._local.clear()
+
+
+token_cache = TokenCache.from_settings()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token and user query for tokens
+    seen recently.
+
+    Entries are dropped when the token is deleted or its user is saved.
+    Other processes keep their local copy until its TTL runs out.
+    """
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        token = self.cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            self.cache.set(key, token)
+        return (token.user, token)
@@ -1,3 +1,4 @@
+from user.authentication import CachedTokenAuthentication
 from user.serializers import (
     UserSerializer,
     TokenSerializer,
@@ -5,7 +6,6 @@ from user.serializers import (
 from rest_framework import (
     generics,
     permissions,
-    authentication,
 )
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
@@ -22,7 +22,7 @@ class CreateTokenView(ObtainAuthToken):
 
 class UpdateUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
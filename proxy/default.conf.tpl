@@ -5,6 +5,26 @@ server {
         alias   /vol/static;
     }
 
+    # collectstatic output; hashed names never change content
+    location /static/static/ {
+        alias   /vol/static/static/;
+        gzip_static on;
+        gzip_vary on;
+        expires 1h;
+
+        location ~ "\.[0-9a-f]{12}\.[A-Za-z0-9]+$" {
+            # drop the inherited expires so only one Cache-Control is sent
+            expires off;
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+    }
+
+    # uploads are named by content hash (or a fresh uuid), never rewritten
+    location /static/media/uploads/ {
+        alias   /vol/static/media/uploads/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location / {
         uwsgi_pass            ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
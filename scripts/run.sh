@@ -8,4 +8,8 @@ python manage.py collectstatic --noinput
 
 python manage.py migrate
 
+if [ -n "$API_SCHEMA_FILE" ]; then
+    python manage.py spectacular --format openapi-json --file "$API_SCHEMA_FILE"
+fi
+
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file